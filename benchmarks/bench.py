@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Benchmark tellduslive against a local fake Telldus server.
+
+Usage:
+  bench.py [options]
+
+Measures Session.update() cold and warm, execute() throughput,
+listener packet handling rate and memory per device, and optionally
+writes the results as JSON for comparison between revisions."""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import tellduslive  # noqa: E402
+from fake_server import FakeTelldusServer, make_packet  # noqa: E402
+
+
+def session(server, args):
+    """Create session against the fake server."""
+    if args.live:
+        tellduslive.TELLDUS_LIVE_API_URL = server.live_url
+        return tellduslive.Session('public', 'private', 'token', 'secret',
+                                   workers=args.workers)
+    return tellduslive.Session(host=server.host, token='token',
+                               workers=args.workers)
+
+
+def timed(func, *args):
+    """Return elapsed seconds and result of call."""
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+
+def bench_update(server, args):
+    """Cold and warm Session.update(), and memory per device."""
+    sess = session(server, args)
+    cold, ok = timed(sess.update)
+    assert ok, 'update failed'
+    warm, _ = timed(sess.update)
+
+    # memory retained by the state of a session, measured separately
+    # since tracing slows down everything else
+    gc.collect()
+    tracemalloc.start()
+    other = session(server, args)
+    other.update()
+    other.close()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    entries = len(server.devices) + len(server.sensors)
+    return sess, {'update_cold_s': cold,
+                  'update_warm_s': warm,
+                  'bytes_per_device': current / max(entries, 1)}
+
+
+def bench_execute(sess, server, args):
+    """Commands per second, sequential and concurrent."""
+    ids = [device['id'] for device in server.devices][:args.commands]
+    elapsed, _ = timed(lambda: [sess.device(device_id).turn_on()
+                                for device_id in ids])
+    sequential = len(ids) / elapsed
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        elapsed, _ = timed(lambda: list(pool.map(
+            lambda device_id: sess.device(device_id).turn_off(), ids)))
+    return {'execute_sequential_per_s': sequential,
+            'execute_concurrent_per_s': len(ids) / elapsed}
+
+
+def bench_listener(sess, server, args):
+    """Asynchronous packets handled per second."""
+    packets = [make_packet(sensor, seed)
+               for seed in range(args.packets // max(len(server.sensors), 1)
+                                 or 1)
+               for sensor in server.sensors][:args.packets]
+    # pylint: disable=protected-access
+    elapsed, _ = timed(lambda: [sess._got(packet, None)
+                                for packet in packets])
+    return {'packets_per_s': len(packets) / elapsed}
+
+
+def main():
+    """Run benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--sensors', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds of latency per request')
+    parser.add_argument('--workers', type=int,
+                        default=tellduslive.DEFAULT_WORKERS)
+    parser.add_argument('--commands', type=int, default=100)
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--live', action='store_true',
+                        help='use the Live API (OAuth1) instead of local API')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write results as JSON')
+    args = parser.parse_args()
+
+    with FakeTelldusServer(args.devices, args.sensors,
+                           args.latency) as server:
+        sess, results = bench_update(server, args)
+        results.update(bench_execute(sess, server, args))
+        server.latency = 0
+        results.update(bench_listener(sess, server, args))
+        results['requests'] = dict(server.counts)
+        sess.close()
+
+    for key, value in sorted(results.items()):
+        if isinstance(value, float):
+            print('{:<28} {:>12.4f}'.format(key, value))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(dict(results, args=vars(args)), output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
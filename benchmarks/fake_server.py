@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Local stand-in for Telldus Live (/json/) and a ZNet (/api/).
+
+Serves generated devices and sensors with configurable counts and
+injected latency, for benchmarking without network access."""
+
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock, Thread
+from time import sleep, time
+from urllib.parse import parse_qsl, urlsplit
+
+_LOGGER = logging.getLogger(__name__)
+
+PROTOCOLS = [('fineoffset', 'temperaturehumidity'),
+             ('mandolyn', 'temperaturehumidity'),
+             ('oregon', 'EA4C')]
+
+# Offset of sensor ids, so they do not overlap device ids
+SENSOR_ID_OFFSET = 1000000
+
+
+def make_devices(count):
+    """Generate devices/list entries."""
+    return [{'id': str(i),
+             'name': 'Device {}'.format(i),
+             'state': 2,
+             'statevalue': '0',
+             'methods': 19,
+             'type': 'device'}
+            for i in range(1, count + 1)]
+
+
+def make_device_info(device_id):
+    """Generate device/info response for a device."""
+    return {'id': device_id,
+            'name': 'Device {}'.format(device_id),
+            'state': 2,
+            'statevalue': '0',
+            'methods': 19,
+            'protocol': 'arctech',
+            'model': 'selflearning-switch',
+            'client': '1',
+            'parameter': [{'name': 'house', 'value': str(device_id)},
+                          {'name': 'unit', 'value': '1'}]}
+
+
+def make_sensors(count, seed=0):
+    """Generate sensors/list entries."""
+    rnd = Random(seed)
+    now = int(time())
+    sensors = []
+    for i in range(1, count + 1):
+        protocol, model = PROTOCOLS[i % len(PROTOCOLS)]
+        sensors.append({
+            'id': str(SENSOR_ID_OFFSET + i),
+            'name': 'Sensor {}'.format(i),
+            'protocol': protocol,
+            'model': model,
+            'sensorId': i,
+            'battery': 253,
+            'lastUpdated': now - rnd.randint(0, 600),
+            'data': [{'name': 'temp',
+                      'value': '{:.1f}'.format(rnd.uniform(-10, 30)),
+                      'scale': '0'},
+                     {'name': 'humidity',
+                      'value': str(rnd.randint(20, 90)),
+                      'scale': '0'}]})
+    return sensors
+
+
+def make_history(sensor_id, start, end, interval=600):
+    """Generate sensor/history entries, one reading per interval."""
+    rnd = Random('{}:{}'.format(sensor_id, start))
+    return [{'ts': ts,
+             'data': [{'name': 'temp',
+                       'value': '{:.1f}'.format(rnd.uniform(-10, 30)),
+                       'scale': '0'},
+                      {'name': 'humidity',
+                       'value': str(rnd.randint(20, 90)),
+                       'scale': '0'}]}
+            for ts in range(start - start % interval + interval, end,
+                            interval)]
+
+
+def make_packet(sensor, seed=0):
+    """Generate an asynchronous UDP packet, as delivered by tellsticknet,
+    for a sensor."""
+    rnd = Random(seed)
+    return {'id': sensor['id'],
+            'protocol': sensor['protocol'],
+            'model': sensor['model'],
+            'sensorId': sensor['sensorId'],
+            'data': [{'name': 'temp',
+                      'value': '{:.1f}'.format(rnd.uniform(-10, 30)),
+                      'scale': '0'},
+                     {'name': 'humidity',
+                      'value': str(rnd.randint(20, 90)),
+                      'scale': '0'}]}
+
+
+class _Server(ThreadingHTTPServer):
+    """Threading HTTP server accepting many concurrent clients."""
+
+    request_queue_size = 128
+
+
+class FakeTelldusServer:
+    """HTTP server answering like Telldus Live and the ZNet local API."""
+
+    def __init__(self, devices=10, sensors=10, latency=0.0,
+                 host='127.0.0.1', port=0):
+        self.devices = make_devices(devices)
+        self.sensors = make_sensors(sensors)
+        self.latency = latency
+        self.counts = {}
+        self._lock = Lock()
+        self._server = _Server((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        """host:port of the server, as used for local API sessions."""
+        return '{}:{}'.format(*self._server.server_address)
+
+    @property
+    def live_url(self):
+        """Base url to use instead of TELLDUS_LIVE_API_URL."""
+        return 'http://{}/json/'.format(self.host)
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = Thread(target=self._server.serve_forever,
+                              name='fake-telldus', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counts(self):
+        """Clear the per endpoint request counters."""
+        with self._lock:
+            self.counts.clear()
+
+    def respond(self, endpoint, params):
+        """Return response to a request for an endpoint."""
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+        if endpoint in ('token', 'refreshToken'):
+            return {'token': 'fake-token', 'expires': int(time()) + 86400}
+        if endpoint == 'devices/list':
+            return {'device': self.devices}
+        if endpoint == 'sensors/list':
+            return {'sensor': self.sensors}
+        if endpoint == 'device/info':
+            return make_device_info(params.get('id'))
+        if endpoint == 'sensor/info':
+            return next((sensor for sensor in self.sensors
+                         if sensor['id'] == params.get('id')),
+                        {'error': 'Sensor not found'})
+        if endpoint == 'sensor/history':
+            return {'history': make_history(params.get('id'),
+                                            int(params.get('from')),
+                                            int(params.get('to')))}
+        if endpoint.startswith('device/'):
+            return {'status': 'success'}
+        return {'error': 'Unknown endpoint {}'.format(endpoint)}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler."""
+
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Answer /json/<endpoint> and /api/<endpoint>."""
+                url = urlsplit(self.path)
+                _, _, endpoint = url.path.lstrip('/').partition('/')
+                if server.latency:
+                    sleep(server.latency)
+                body = json.dumps(server.respond(
+                    endpoint, dict(parse_qsl(url.query)))).encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_PUT = do_GET
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds of latency per request')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    server = FakeTelldusServer(args.devices, args.sensors, args.latency,
+                               port=args.port)
+    print('Serving on http://{}/ (json/ and api/)'.format(server.host))
+    server.start()
+    try:
+        server._thread.join()  # pylint: disable=protected-access
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Measure startup time of `import tellduslive` and `tellduslive --version`.
+
+Usage:
+  import_time.py [options]
+
+Each command is run in a fresh interpreter a number of times and the
+best time, less the time of starting an interpreter that does nothing,
+is compared to its target. Exits with status 1 if a target is missed,
+or if importing the module imports a dependency that should only load
+on first use. The targets assume bytecode caching is enabled (i.e.
+PYTHONDONTWRITEBYTECODE is not set)."""
+
+import argparse
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# seconds on top of interpreter startup
+TARGETS = {
+    'import': 0.03,
+    'version': 0.04,
+}
+
+# must not be imported by `import tellduslive`
+LAZY_MODULES = ('requests', 'requests_oauthlib', 'oauthlib', 'asyncio',
+                'aiohttp', 'numpy', 'pyarrow')
+
+COMMANDS = {
+    'baseline': [sys.executable, '-c', 'pass'],
+    'import': [sys.executable, '-c', 'import tellduslive'],
+    'version': [sys.executable, os.path.join(ROOT, 'tellduslive'),
+                '--version'],
+}
+
+
+def best(command, repeat):
+    """Best wall time of running command."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run(command, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def eager_imports():
+    """Lazy dependencies imported by `import tellduslive`."""
+    output = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, tellduslive; print(*sorted(sys.modules))'],
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return sorted(set(output.split()) & set(LAZY_MODULES))
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    baseline = best(COMMANDS['baseline'], args.repeat)
+    print('{:<28} {:>12.4f}'.format('interpreter', baseline))
+    failed = False
+    for name, target in sorted(TARGETS.items()):
+        elapsed = best(COMMANDS[name], args.repeat) - baseline
+        missed = elapsed > target
+        failed |= missed
+        print('{:<28} {:>12.4f} (target {:.3f}){}'.format(
+            name, elapsed, target, ' MISSED' if missed else ''))
+    eager = eager_imports()
+    if eager:
+        failed = True
+        print('Imported eagerly:', ', '.join(eager))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
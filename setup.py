@@ -16,4 +16,7 @@ setup(name='tellduslive',
       scripts=['tellduslive'],
       extras_require={
           'console':  ['docopt'],
+          'async': ['aiohttp'],
+          'parquet': ['pyarrow'],
+          'json': ['orjson'],
       })
@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 # -*- mode: python; coding: utf-8 -*-
 
+import json
 import logging
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from codecs import getincrementaldecoder
+from collections import Counter, deque, namedtuple, OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain, count, islice, repeat, zip_longest
+from queue import Empty, Full, Queue
 import sys
-import requests
-from requests.compat import urljoin
-from requests_oauthlib import OAuth1Session
-from threading import RLock
+from sys import intern
+from tempfile import mkstemp
+from time import monotonic, time
+from importlib import import_module
+from threading import Condition, Event, Lock, RLock, Thread, Timer
+from urllib.parse import urljoin, urlencode
 
 sys.version_info >= (3, 0) or exit('Python 3 required')
 
@@ -15,6 +28,23 @@ __version__ = '0.10.4'
 
 _LOGGER = logging.getLogger(__name__)
 
+
+class _LazyModule:
+    """Stand-in for a module, imported on first use."""
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        return getattr(import_module(self.__name), attr)
+
+
+# imported on first use, to keep importing this module fast
+asyncio = _LazyModule('asyncio')
+requests = _LazyModule('requests')
+
+_TRANSPORTS_LOCK = Lock()
+
 TELLDUS_LIVE_API_URL = 'https://api.telldus.com/json/'
 TELLDUS_LIVE_REQUEST_TOKEN_URL = 'https://api.telldus.com/oauth/requestToken'
 TELLDUS_LIVE_AUTHORIZE_URL = 'https://api.telldus.com/oauth/authorize'
@@ -26,6 +56,57 @@ TELLDUS_LOCAL_REFRESH_TOKEN_URL = 'http://{host}/api/refreshToken'
 
 TIMEOUT = timedelta(seconds=10)
 
+# Max number of concurrent requests to the API
+DEFAULT_WORKERS = 8
+
+# Commands to a coalescing device within this window are merged
+COALESCE_WINDOW = timedelta(milliseconds=250)
+
+# Length of the time range of each sensor/history request
+HISTORY_CHUNK = timedelta(days=1)
+
+# Number of readings kept per sensor item in SensorHistory
+DEFAULT_HISTORY_SIZE = 1024
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   float('inf'))
+
+# Default requests per second to each class of endpoint, see RateLimiter
+DEFAULT_RATES = {'command': 10, 'info': 5, 'list': 1}
+
+# Default schedule of SessionManager.start()
+POLL_INTERVAL = timedelta(minutes=1)
+UPDATE_INTERVAL = timedelta(minutes=10)
+
+# Adaptive polling of PollingScheduler: bounds of the interval between
+# refreshes of a device, and number of stale devices for which a single
+# list request is cheaper
+SCHEDULER_MIN_INTERVAL = timedelta(seconds=10)
+SCHEDULER_MAX_INTERVAL = timedelta(minutes=30)
+LIST_THRESHOLD = 3
+
+# Daemon serving a session to local clients, see Daemon
+DAEMON_PORT = 8765
+DAEMON_TOKEN_LIFETIME = 365 * 24 * 60 * 60
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_PING = 30  # seconds
+WEBSOCKET_QUEUE = 1000  # events queued per client
+
+# Interval between checks of a failed transport of HybridAPISession
+PROBE_INTERVAL = timedelta(seconds=30)
+
+# Tokens of the local API are refreshed in the background once this
+# part of their lifetime has passed, or after TOKEN_LIFETIME if the
+# expiry is unknown. Failed refreshes are retried with backoff.
+TOKEN_REFRESH_AT = 0.8
+TOKEN_LIFETIME = timedelta(hours=12)
+TOKEN_RETRY = timedelta(seconds=10)
+TOKEN_RETRY_MAX = timedelta(minutes=10)
+
+# Identical asynchronous packets received within this window are dropped
+DEDUP_WINDOW = timedelta(seconds=2)
+
 UNNAMED_DEVICE = 'NO NAME'
 
 # Tellstick methods
@@ -64,6 +145,16 @@ METHODS = {
     THERMOSTAT: 'thermostat'
 }
 
+# Device methods performing the supported methods
+COMMANDS = {
+    TURNON: 'turn_on',
+    TURNOFF: 'turn_off',
+    DIM: 'dim',
+    UP: 'up',
+    DOWN: 'down',
+    STOP: 'stop'
+}
+
 # Sensor types
 TEMPERATURE = 'temperature'
 HUMIDITY = 'humidity'
@@ -84,6 +175,34 @@ BATTERY_OK = 253
 
 SUPPORTS_LOCAL_API = ['TellstickZnet', 'TellstickNetV2']
 
+# Fields of a device that are reported as change events
+WATCHED_FIELDS = ('name', 'state', 'statevalue', 'battery', 'data')
+
+# Items of responses to list endpoints, and the fields of them used by
+# Device, the only ones kept
+LIST_KEYS = {'devices/list': 'device', 'sensors/list': 'sensor'}
+LIST_FIELDS = frozenset(('id', 'name', 'state', 'statevalue', 'methods',
+                         'battery', 'unit', 'house', 'protocol', 'model',
+                         'sensorId', 'lastUpdated', 'data'))
+
+# Bytes read at a time from responses to list endpoints
+STREAM_CHUNK = 64 * 1024
+
+# Fields of a device stored in the state cache
+CACHED_FIELDS = ('id', 'name', 'state', 'statevalue', 'methods', 'battery',
+                 'parameters', 'protocol', 'model', 'client_id',
+                 'sensorId', 'lastUpdated', 'data')
+
+STATE_CACHE_VERSION = 1
+
+_NULL_CONTEXT = nullcontext()
+
+Reading = namedtuple('Reading',
+                     'device_id timestamp name scale value')
+
+ChangeEvent = namedtuple('ChangeEvent',
+                         'device_id field old new timestamp')
+
 
 def supports_local_api(device):
     """Return true if the device supports local access."""
@@ -91,130 +210,523 @@ def supports_local_api(device):
                for dev in SUPPORTS_LOCAL_API)
 
 
-class LocalAPISession(requests.Session):
-    """Connect directly to the device."""
+def _token_expiry(result):
+    """Return expiry of token in response, if any."""
+    expires = result.get('expires')
+    return datetime.fromtimestamp(expires) if expires else None
 
-    def __init__(self, host, application, access_token=None):
-        super().__init__()
-        self.url = TELLDUS_LOCAL_API_URL.format(host=host)
-        self._host = host
-        self._application = application
-        self.request_token = None
-        self.token_timestamp = None
-        self.access_token = access_token
-        if access_token:
+
+def _refresh_delay(expires):
+    """Seconds until a token expiring at expires should be refreshed."""
+    if not expires:
+        return TOKEN_LIFETIME.total_seconds()
+    left = (expires - datetime.now()).total_seconds()
+    return max(0, left * TOKEN_REFRESH_AT)
+
+
+def _retry_delay(retry):
+    """Seconds until the next attempt after a failed token refresh."""
+    return min(TOKEN_RETRY.total_seconds() * 2 ** retry,
+               TOKEN_RETRY_MAX.total_seconds())
+
+
+def _local_api_session():
+    """Define LocalAPISession, importing requests."""
+
+    class LocalAPISession(requests.Session):
+        """Connect directly to the device."""
+
+        streams = True  # responses can be read incrementally
+
+        def __init__(self, host, application, access_token=None):
+            super().__init__()
+            self.url = TELLDUS_LOCAL_API_URL.format(host=host)
+            self._host = host
+            self._application = application
+            self.request_token = None
+            self.token_timestamp = None
+            self.token_expires = None
+            self.access_token = access_token
+            self._refresh_lock = Lock()
+            self._timer_lock = Lock()
+            self._timer = None
+            self._retry = 0
+            self._closed = False
+            if access_token:
+                self.headers.update(
+                    {'Authorization': 'Bearer {}'.format(self.access_token)})
+                # learn the expiry of the token
+                self._schedule_refresh(0)
+
+        @property
+        def authorize_url(self):
+            """Retrieve URL for authorization."""
+            try:
+                response = self.put(
+                    TELLDUS_LOCAL_REQUEST_TOKEN_URL.format(host=self._host),
+                    data={'app': self._application},
+                    timeout=TIMEOUT.seconds)
+                response.raise_for_status()
+                result = response.json()
+                self.request_token = result.get('token')
+                return result.get('authUrl')
+            except (OSError, ValueError) as e:
+                _LOGGER.error('Failed to retrieve authorization URL: %s', e)
+
+        def authorize(self):
+            """Perform authorization."""
+            try:
+                response = self.get(
+                    TELLDUS_LOCAL_REQUEST_TOKEN_URL.format(host=self._host),
+                    params=dict(token=self.request_token),
+                    timeout=TIMEOUT.seconds)
+                response.raise_for_status()
+                result = response.json()
+                if 'token' in result:
+                    self._set_token(result)
+                    self._schedule_refresh(_refresh_delay(self.token_expires))
+                    return True
+            except OSError as e:
+                _LOGGER.error('Failed to authorize: %s', e)
+
+        def _set_token(self, result):
+            """Use token in response for further requests."""
+            self.access_token = result['token']
             self.headers.update(
                 {'Authorization': 'Bearer {}'.format(self.access_token)})
-            self.refresh_access_token()
+            self.token_timestamp = datetime.now()
+            self.token_expires = _token_expiry(result)
+            _LOGGER.debug('Token expires %s', self.token_expires)
+
+        def refresh_access_token(self):
+            """Refresh api token"""
+            with self._refresh_lock:
+                try:
+                    response = self.get(
+                        TELLDUS_LOCAL_REFRESH_TOKEN_URL.format(
+                            host=self._host),
+                        timeout=TIMEOUT.seconds)
+                    response.raise_for_status()
+                    result = response.json()
+                    if 'token' not in result:
+                        raise ValueError(result.get('error', 'No token'))
+                    self._set_token(result)
+                    return True
+                except (OSError, ValueError) as e:
+                    _LOGGER.error('Failed to refresh access token: %s', e)
+
+        def _schedule_refresh(self, delay):
+            """Refresh token in the background after delay seconds."""
+            with self._timer_lock:
+                if self._timer:
+                    self._timer.cancel()
+                if self._closed:
+                    return
+                self._timer = Timer(delay, self._refresh)
+                self._timer.daemon = True
+                self._timer.start()
+
+        def _refresh(self):
+            """Refresh token and schedule the next refresh or a retry."""
+            if self.refresh_access_token():
+                self._retry = 0
+                self._schedule_refresh(_refresh_delay(self.token_expires))
+            else:
+                self._schedule_refresh(_retry_delay(self._retry))
+                self._retry += 1
+
+        def authorized(self):
+            """Return true if successfully authorized."""
+            return self.access_token
+
+        def maybe_refresh_token(self):
+            """Make sure the token is refreshed in the background.
+            Never waits for a refresh."""
+            if self.access_token and not self._timer:
+                self._schedule_refresh(0)
+
+        def close(self):
+            """Stop refreshing the token and close connections."""
+            with self._timer_lock:
+                self._closed = True
+                if self._timer:
+                    self._timer.cancel()
+            super().close()
+
+    return LocalAPISession
+
+
+def _live_api_session():
+    """Define LiveAPISession, importing requests_oauthlib."""
+    # pylint: disable=import-outside-toplevel
+    from requests_oauthlib import OAuth1Session
+
+    class LiveAPISession(OAuth1Session):
+        """Connection to the cloud service."""
+
+        streams = True  # responses can be read incrementally
+
+        # pylint: disable=too-many-arguments
+        def __init__(self,
+                     public_key,
+                     private_key,
+                     token=None,
+                     token_secret=None,
+                     application=None):
+            super().__init__(public_key, private_key, token, token_secret)
+            self.url = TELLDUS_LIVE_API_URL
+            self.access_token = None
+            self.access_token_secret = None
+            if application:
+                self.headers.update({'X-Application': application})
+
+        @property
+        def authorize_url(self):
+            """Retrieve URL for authorization."""
+            _LOGGER.debug('Fetching request token')
+            try:
+                self.fetch_request_token(
+                    TELLDUS_LIVE_REQUEST_TOKEN_URL, timeout=TIMEOUT.seconds)
+                _LOGGER.debug('Got request token')
+                return self.authorization_url(TELLDUS_LIVE_AUTHORIZE_URL)
+            except (OSError, ValueError) as e:
+                _LOGGER.error('Failed to retrieve authorization URL: %s', e)
+
+        def authorize(self):
+            """Perform authorization."""
+            try:
+                _LOGGER.debug('Fetching access token')
+                token = self._fetch_token(
+                    TELLDUS_LIVE_ACCESS_TOKEN_URL, timeout=TIMEOUT.seconds)
+                _LOGGER.debug('Got access token')
+                self.access_token = token['oauth_token']
+                self.access_token_secret = token['oauth_token_secret']
+                _LOGGER.debug('Authorized: %s', self.authorized)
+                return self.authorized
+            except (OSError, ValueError) as e:
+                _LOGGER.error('Failed to authorize: %s', e)
+
+        def maybe_refresh_token(self):
+            """Refresh access_token if expired."""
+            pass
+
+    return LiveAPISession
+
+
+# Transports depending on requests, defined on first use
+_TRANSPORTS = {
+    'LocalAPISession': _local_api_session,
+    'LiveAPISession': _live_api_session,
+}
+
+
+def __getattr__(name):
+    """Define transport classes on first use, so that requests is
+    only imported when needed."""
+    if name not in _TRANSPORTS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+    with _TRANSPORTS_LOCK:
+        if name not in globals():
+            cls = _TRANSPORTS[name]()
+            cls.__qualname__ = name
+            globals()[name] = cls
+    return globals()[name]
+
+
+def _transport(name):
+    """Return transport class, defining it if needed."""
+    return globals().get(name) or __getattr__(name)
+
+
+class _Route:
+    """Measured latency and error rate of a transport."""
+
+    __slots__ = ('name', 'transport', 'latency', 'error_rate', 'healthy')
+
+    def __init__(self, name, transport):
+        self.name = name
+        self.transport = transport
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.healthy = True
+
+    def cost(self):
+        """Expected time of a request, counting failed attempts."""
+        return self.latency / (1 - min(self.error_rate, 0.9))
+
+
+class _RoutedResponse:
+    """Decoded response, with ids of the local API translated to the
+    Live API."""
+
+    def __init__(self, response, result):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+        self._result = result
+
+    def raise_for_status(self):
+        """Already checked by HybridAPISession."""
+
+    def json(self):
+        """Return the decoded result."""
+        return self._result
+
+
+class HybridAPISession:
+    """Send each request to the local API or the Live API, whichever
+    is fastest and healthy, failing over to the other one.
+
+    Requests and responses use the ids of the Live API. The local API
+    numbers devices differently, so its ids are mapped by name in the
+    background, which requires both APIs to be reachable. Until then,
+    for devices without a unique name on both, and for lists with such
+    devices, the Live API is used. The mapping is renewed when a list
+    shows devices it does not know. A failed transport is probed in
+    the background until it recovers."""
+
+    ALPHA = 0.2  # weight of the latest request in latency and error rate
+
+    def __init__(self, local, live, probe_interval=PROBE_INTERVAL):
+        self.url = ''
+        self._local = _Route('local', local)
+        self._live = _Route('live', live)
+        self._probe_interval = probe_interval.total_seconds()
+        self._lock = Lock()
+        # by list key, as devices and sensors are numbered separately
+        self._to_local = None  # Live id -> local id
+        self._to_live = None  # local id -> Live id
+        self._unmapped = {}  # Live ids without local id
+        self._local_only = {}  # local ids not in the Live API
+        self._stale = False  # mapping to be renewed
+        self._probe = None
 
     @property
     def authorize_url(self):
         """Retrieve URL for authorization."""
-        try:
-            response = self.put(
-                TELLDUS_LOCAL_REQUEST_TOKEN_URL.format(host=self._host),
-                data={'app': self._application},
-                timeout=TIMEOUT.seconds)
-            response.raise_for_status()
-            result = response.json()
-            self.request_token = result.get('token')
-            return result.get('authUrl')
-        except (OSError, ValueError) as e:
-            _LOGGER.error('Failed to retrieve authorization URL: %s', e)
+        return self._live.transport.authorize_url
 
     def authorize(self):
         """Perform authorization."""
-        try:
-            response = self.get(
-                TELLDUS_LOCAL_REQUEST_TOKEN_URL.format(host=self._host),
-                params=dict(token=self.request_token),
-                timeout=TIMEOUT.seconds)
-            response.raise_for_status()
-            result = response.json()
-            if 'token' in result:
-                self.access_token = result['token']
-                self.headers.update(
-                    {'Authorization': 'Bearer {}'.format(self.access_token)})
-                self.token_timestamp = datetime.now()
-                token_expiry = datetime.fromtimestamp(result.get('expires'))
-                _LOGGER.debug('Token expires %s', token_expiry)
-                return True
-        except OSError as e:
-            _LOGGER.error('Failed to authorize: %s', e)
-
-    def refresh_access_token(self):
-        """Refresh api token"""
-        try:
-            response = self.get(
-                TELLDUS_LOCAL_REFRESH_TOKEN_URL.format(host=self._host))
-            response.raise_for_status()
-            result = response.json()
-            self.access_token = result.get('token')
-            self.token_timestamp = datetime.now()
-            token_expiry = datetime.fromtimestamp(result.get('expires'))
-            _LOGGER.debug('Token expires %s', token_expiry)
-            return True
-        except OSError as e:
-            _LOGGER.error('Failed to refresh access token: %s', e)
+        return self._live.transport.authorize()
 
+    @property
     def authorized(self):
         """Return true if successfully authorized."""
-        return self.access_token
+        return self._live.transport.authorized
+
+    @property
+    def access_token(self):
+        """Return access token."""
+        return self._live.transport.access_token
+
+    @property
+    def access_token_secret(self):
+        """Return the token secret."""
+        return self._live.transport.access_token_secret
 
     def maybe_refresh_token(self):
         """Refresh access_token if expired."""
-        if self.token_timestamp:
-            age = datetime.now() - self.token_timestamp
-            if age > timedelta(seconds=(12 * 60 * 60)):  # 12 hours
-                self.refresh_access_token()
+        self._local.transport.maybe_refresh_token()
+        self._live.transport.maybe_refresh_token()
+
+    def routes(self):
+        """Return latency, error rate and health of each transport."""
+        return {route.name: dict(latency=route.latency,
+                                 error_rate=route.error_rate,
+                                 healthy=route.healthy)
+                for route in (self._local, self._live)}
+
+    def close(self):
+        """Stop probing and close both transports."""
+        with self._lock:
+            if self._probe:
+                self._probe.cancel()
+                self._probe = None
+        self._local.transport.close()
+        self._live.transport.close()
 
+    @staticmethod
+    def _fetch(route, path, params=None, timeout=TIMEOUT.seconds):
+        """Request path from a single transport."""
+        response = route.transport.get(urljoin(route.transport.url, path),
+                                       params=params,
+                                       timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    def _update_ids(self):
+        """Map ids of the Live API to the local API by name."""
+        mapping = {}
+        unmapped = {}
+        local_only = {}
+        for path, key in LIST_KEYS.items():
+            names = []
+            ids = []
+            for route in (self._live, self._local):
+                try:
+                    items = self._fetch(route, path).json().get(key) or []
+                except (OSError, ValueError) as e:
+                    self._failed(route, e)
+                    raise
+                counts = Counter(item.get('name') for item in items)
+                names.append({item['name']: str(item['id'])
+                              for item in items
+                              if counts[item.get('name')] == 1})
+                ids.append({str(item.get('id')) for item in items})
+            live, local = names
+            mapped = {live[name]: local[name]
+                      for name in live.keys() & local.keys()}
+            mapping[key] = mapped
+            unmapped[key] = frozenset(ids[0] - mapped.keys())
+            local_only[key] = frozenset(ids[1] - set(mapped.values()))
+        with self._lock:
+            self._to_local = mapping
+            self._to_live = {key: {v: k for k, v in mapped.items()}
+                             for key, mapped in mapping.items()}
+            self._unmapped = unmapped
+            self._local_only = local_only
+            self._stale = False
+        _LOGGER.debug('Mapped %d ids to the local API, %d not mapped',
+                      sum(map(len, mapping.values())),
+                      sum(map(len, unmapped.values())))
+
+    def _remap(self):
+        """Renew the id mapping in the background."""
+        with self._lock:
+            self._stale = True
+            self._schedule_probe(0)
 
-class LiveAPISession(OAuth1Session):
-    """Connection to the cloud service."""
+    @staticmethod
+    def _key(path):
+        """The list key of the ids used by path."""
+        return 'sensor' if path.startswith('sensor') else 'device'
 
-    # pylint: disable=too-many-arguments
-    def __init__(self,
-                 public_key,
-                 private_key,
-                 token=None,
-                 token_secret=None,
-                 application=None):
-        super().__init__(public_key, private_key, token, token_secret)
-        self.url = TELLDUS_LIVE_API_URL
-        self.access_token = None
-        self.access_token_secret = None
-        if application:
-            self.headers.update({'X-Application': application})
+    def _local_params(self, path, params):
+        """Params for the local API, or None if it can not be used."""
+        if self._to_local is None or self._stale:
+            return None
+        key = self._key(path)
+        if path in LIST_KEYS and self._unmapped.get(key):
+            return None  # the list would lack the unmapped devices
+        if 'id' not in (params or {}):
+            return params or {}
+        local_id = self._to_local.get(key, {}).get(str(params['id']))
+        return local_id and dict(params, id=local_id)
+
+    def _live_result(self, path, result):
+        """Translate ids of a local API result to the Live API, leaving
+        out devices unknown to it. Returns None if a list has devices
+        not seen when mapping ids."""
+        if not isinstance(result, dict):
+            return result
+        for key in LIST_KEYS.values():
+            if key in result:
+                to_live = self._to_live.get(key, {})
+                local_only = self._local_only.get(key, ())
+                if not all(str(item.get('id')) in to_live or
+                           str(item.get('id')) in local_only
+                           for item in result[key]):
+                    return None
+                result[key] = [dict(item, id=to_live[str(item['id'])])
+                               for item in result[key]
+                               if str(item.get('id')) in to_live]
+        to_live = self._to_live.get(self._key(path), {})
+        if 'id' in result and str(result['id']) in to_live:
+            result['id'] = to_live[str(result['id'])]
+        return result
+
+    def _known(self, result):
+        """Return true unless a Live API list has devices
+        not seen when mapping ids."""
+        if self._to_local is None or not isinstance(result, dict):
+            return True
+        return all(str(item.get('id')) in self._to_local.get(key, {}) or
+                   str(item.get('id')) in self._unmapped.get(key, ())
+                   for key in LIST_KEYS.values()
+                   for item in result.get(key) or ())
 
-    @property
-    def authorize_url(self):
-        """Retrieve URL for authorization."""
-        _LOGGER.debug('Fetching request token')
-        try:
-            self.fetch_request_token(
-                TELLDUS_LIVE_REQUEST_TOKEN_URL, timeout=TIMEOUT.seconds)
-            _LOGGER.debug('Got request token')
-            return self.authorization_url(TELLDUS_LIVE_AUTHORIZE_URL)
-        except (OSError, ValueError) as e:
-            _LOGGER.error('Failed to retrieve authorization URL: %s', e)
+    def _succeeded(self, route, elapsed):
+        with self._lock:
+            route.latency += self.ALPHA * (elapsed - route.latency)
+            route.error_rate -= self.ALPHA * route.error_rate
+            route.healthy = True
 
-    def authorize(self):
-        """Perform authorization."""
-        try:
-            _LOGGER.debug('Fetching access token')
-            token = self._fetch_token(
-                TELLDUS_LIVE_ACCESS_TOKEN_URL, timeout=TIMEOUT.seconds)
-            _LOGGER.debug('Got access token')
-            self.access_token = token['oauth_token']
-            self.access_token_secret = token['oauth_token_secret']
-            _LOGGER.debug('Authorized: %s', self.authorized)
-            return self.authorized
-        except (OSError, ValueError) as e:
-            _LOGGER.error('Failed to authorize: %s', e)
+    def _failed(self, route, error):
+        _LOGGER.warning('Request to %s API failed: %s', route.name, error)
+        with self._lock:
+            route.error_rate += self.ALPHA * (1 - route.error_rate)
+            route.healthy = False
+            self._schedule_probe(self._probe_interval)
+
+    def _schedule_probe(self, delay):
+        """Start background probe unless pending. Call with lock held."""
+        if not self._probe:
+            self._probe = Timer(delay, self._probe_routes)
+            self._probe.daemon = True
+            self._probe.start()
+
+    def _probe_routes(self):
+        """Check failed transports and the id mapping in the background."""
+        for route in (self._local, self._live):
+            if not route.healthy:
+                start = monotonic()
+                try:
+                    self._fetch(route, 'devices/list',
+                                params=dict(supportedMethods=0))
+                    _LOGGER.info('%s API recovered', route.name)
+                    self._succeeded(route, monotonic() - start)
+                except (OSError, ValueError) as e:
+                    _LOGGER.debug('%s API still failing: %s', route.name, e)
+        if ((self._to_local is None or self._stale) and
+                self._local.healthy and self._live.healthy):
+            try:
+                self._update_ids()
+            except (OSError, ValueError) as e:
+                _LOGGER.debug('Failed to map ids: %s', e)
+        with self._lock:
+            self._probe = None
+            if not all((self._local.healthy,
+                        self._live.healthy,
+                        self._to_local is not None,
+                        not self._stale)):
+                self._schedule_probe(self._probe_interval)
 
-    def maybe_refresh_token(self):
-        """Refresh access_token if expired."""
-        pass
+    def get(self, url, params=None, timeout=None):
+        """Send request for path url to the best transport,
+        failing over to the other one."""
+        if self._to_local is None:
+            with self._lock:
+                self._schedule_probe(0)
+        with self._lock:
+            routes = sorted((self._local, self._live),
+                            key=lambda route: (not route.healthy,
+                                               route.cost()))
+        error = None
+        for route in routes:
+            local = route is self._local
+            route_params = (self._local_params(url, params)
+                            if local else params)
+            if local and route_params is None:
+                continue
+            start = monotonic()
+            try:
+                response = self._fetch(route, url, route_params, timeout)
+                result = response.json()
+                self._succeeded(route, monotonic() - start)
+                if local:
+                    result = self._live_result(url, result)
+                    if result is None:
+                        self._remap()
+                        continue
+                elif url in LIST_KEYS and not self._known(result):
+                    self._remap()
+                return _RoutedResponse(response, result)
+            except (OSError, ValueError) as e:
+                self._failed(route, e)
+                error = e
+        raise error or OSError('No transport for {}'.format(url))
 
 
 class LocalUDPSession():
@@ -338,6 +850,443 @@ class LocalUDPSession():
         pass
 
 
+def fast_decoder():
+    """orjson.loads if installed, else None (the standard library)."""
+    try:
+        return import_module('orjson').loads
+    except ImportError:
+        return None
+
+
+def _project(item):
+    """Keep only the fields of a list item used by Device."""
+    return {field: value
+            for field, value in item.items()
+            if field in LIST_FIELDS}
+
+
+def _project_list(result, key):
+    """Project the items of the list under key of a response."""
+    items = result.get(key) if isinstance(result, dict) else None
+    if isinstance(items, list):
+        result[key] = [_project(item) for item in items]
+    return result
+
+
+def _decode(body, path, loads=None):
+    """Decode a response, projecting items of list endpoints."""
+    return _project_list((loads or json.loads)(body), LIST_KEYS.get(path))
+
+
+_JSON_DECODER = json.JSONDecoder()
+_LIST_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def _shared(item):
+    """Projected item with its field names, and those of its sensor
+    readings, shared with other items. Decoding the whole body shares
+    them by itself, items decoded one by one do not."""
+    item = {intern(field): value
+            for field, value in item.items()
+            if field in LIST_FIELDS}
+    data = item.get('data')
+    if isinstance(data, list):
+        item['data'] = [{intern(name): value
+                         for name, value in reading.items()}
+                        if isinstance(reading, dict) else reading
+                        for reading in data]
+    return item
+
+
+class _ListDecoder:
+    """Decode a response to a list endpoint from chunks of bytes as
+    they are read, item by item, keeping only the fields used by
+    Device, so neither the whole body nor all fields of all items are
+    held at once. Falls back to decoding the whole body if it does not
+    start with the list."""
+
+    def __init__(self, key):
+        self.nbytes = 0
+        self._key = key
+        self._prefix = re.compile(r'\s*\{\s*"' + key + r'"\s*:\s*\[')
+        self._text_of = getincrementaldecoder('utf-8')().decode
+        self._text = ''  # not decoded yet
+        self._parts = None  # text of a body that is not a list
+        self._items = None  # decoded items of a list
+        self._rest = None  # text after the list
+
+    def feed(self, chunk):
+        """Decode the items completed by chunk."""
+        self.nbytes += len(chunk)
+        if self._rest is not None:
+            self._rest.append(self._text_of(chunk))
+            return
+        if self._parts is not None:
+            self._parts.append(self._text_of(chunk))
+            return
+        text = self._text + self._text_of(chunk)
+        pos = 0
+        if self._items is None:
+            if len(text) < len(self._key) + 16:
+                self._text = text
+                return
+            match = self._prefix.match(text)
+            if not match:
+                self._parts = [text]
+                self._text = ''
+                return
+            self._items = []
+            pos = match.end()
+        skip = _LIST_SEPARATOR.match
+        decode = _JSON_DECODER.raw_decode
+        append = self._items.append
+        while True:
+            pos = skip(text, pos).end()
+            if pos == len(text):
+                break
+            if text[pos] == ']':
+                self._rest = [text[pos + 1:]]
+                return
+            try:
+                item, pos = decode(text, pos)
+            except ValueError:
+                break  # item continues in next chunk
+            append(_shared(item))
+        self._text = text[pos:]
+
+    def result(self):
+        """Return the decoded response, once all chunks are fed."""
+        if self._items is None:
+            return _project_list(
+                json.loads(''.join(self._parts or ()) + self._text +
+                           self._text_of(b'', final=True)), self._key)
+        if self._rest is None:
+            raise ValueError('Invalid or truncated response')
+        # other members of the response, usually none
+        result = json.loads('{"' + self._key + '":[]' +
+                            ''.join(self._rest) +
+                            self._text_of(b'', final=True))
+        result[self._key] = self._items
+        return result
+
+
+def _stream_list(chunks, key):
+    """Decode a response to a list endpoint from chunks of bytes,
+    as by _ListDecoder. Returns number of bytes read and result."""
+    decoder = _ListDecoder(key)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.nbytes, decoder.result()
+
+
+def _count_items(response):
+    """Number of devices or sensors in a response."""
+    items = response.get('device', response.get('sensor'))
+    return len(items) if isinstance(items, list) else 1
+
+
+def _error_kind(error):
+    """Classify a failed request for instrumentation."""
+    # requests is only loaded if a synchronous session used it
+    timeouts = getattr(sys.modules.get('requests'), 'Timeout', ())
+    return ('timeout'
+            if isinstance(error, (TimeoutError, timeouts))
+            else 'error')
+
+
+class Instrumentation:
+    """Instrumentation hooks of a session, doing nothing.
+    Subclass to forward measurements to a metrics sink,
+    or use Metrics to collect them in memory."""
+
+    enabled = False
+
+    def request(self, endpoint, elapsed, nbytes, items, error=None):
+        """Called after each request. error is None, 'timeout' or 'error'."""
+
+    def operation(self, name, elapsed):
+        """Called after execute, update or handling of a packet."""
+
+    def lock(self, name, wait, hold):
+        """Called when the session lock is released."""
+
+    def timed(self, name):
+        """Context manager reporting elapsed time as an operation."""
+        return _Timer(self, name) if self.enabled else _NULL_CONTEXT
+
+
+class _Timer:
+    """Time a block of code."""
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = monotonic()
+
+    def __exit__(self, *exc):
+        self._instrumentation.operation(self._name,
+                                        monotonic() - self._start)
+
+
+class _TimedLock:
+    """Measure time waiting for and holding a lock."""
+
+    def __init__(self, lock, instrumentation, name):
+        self._lock = lock
+        self._instrumentation = instrumentation
+        self._name = name
+        self._wait = self._acquired = None
+
+    def __enter__(self):
+        start = monotonic()
+        self._lock.acquire()
+        self._acquired = monotonic()
+        self._wait = self._acquired - start
+
+    def __exit__(self, *exc):
+        hold = monotonic() - self._acquired
+        self._lock.release()
+        self._instrumentation.lock(self._name, self._wait, hold)
+
+
+class Metrics(Instrumentation):
+    """Collect per endpoint latency histograms and counters,
+    operation timings and lock wait and hold times in memory."""
+
+    enabled = True
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._buckets = buckets
+        self._lock = Lock()
+        self._endpoints = {}
+        self._operations = {}
+        self._locks = {}
+
+    def reset(self):
+        """Clear all collected measurements."""
+        with self._lock:
+            self._endpoints.clear()
+            self._operations.clear()
+            self._locks.clear()
+
+    def request(self, endpoint, elapsed, nbytes, items, error=None):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if not stats:
+                stats = self._endpoints[endpoint] = dict(
+                    count=0, errors=0, timeouts=0,
+                    bytes=0, items=0, time=0.0,
+                    histogram=[0] * len(self._buckets))
+            stats['count'] += 1
+            stats['bytes'] += nbytes
+            stats['items'] += items
+            stats['time'] += elapsed
+            stats['histogram'][bisect_left(self._buckets, elapsed)] += 1
+            if error == 'timeout':
+                stats['timeouts'] += 1
+            elif error:
+                stats['errors'] += 1
+
+    def operation(self, name, elapsed):
+        with self._lock:
+            stats = self._operations.setdefault(
+                name, dict(count=0, time=0.0, max=0.0))
+            stats['count'] += 1
+            stats['time'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+
+    def lock(self, name, wait, hold):
+        with self._lock:
+            stats = self._locks.setdefault(
+                name, dict(count=0, wait=0.0, hold=0.0,
+                           max_wait=0.0, max_hold=0.0))
+            stats['count'] += 1
+            stats['wait'] += wait
+            stats['hold'] += hold
+            stats['max_wait'] = max(stats['max_wait'], wait)
+            stats['max_hold'] = max(stats['max_hold'], hold)
+
+    def snapshot(self):
+        """Return a copy of the collected measurements."""
+        with self._lock:
+            return dict(
+                requests={
+                    endpoint: dict(stats,
+                                   histogram=dict(zip(self._buckets,
+                                                      stats['histogram'])))
+                    for endpoint, stats in self._endpoints.items()},
+                operations={name: dict(stats)
+                            for name, stats in self._operations.items()},
+                locks={name: dict(stats)
+                       for name, stats in self._locks.items()})
+
+
+class _RingBuffer:
+    """Fixed size buffer of (timestamp, value) pairs, array backed."""
+
+    __slots__ = ('_timestamps', '_values', '_next', '_size')
+
+    def __init__(self, size):
+        self._timestamps = array('d', bytes(8 * size))
+        self._values = array('d', bytes(8 * size))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, value):
+        """Add a reading, overwriting the oldest if full.
+        A reading older than the newest is inserted in order."""
+        if self._size and timestamp < self._timestamps[self._next - 1]:
+            self._insert(timestamp, value)
+            return
+        self._timestamps[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self._size = min(self._size + 1, len(self._values))
+
+    def _insert(self, timestamp, value):
+        """Add a reading out of order, dropping the oldest if full."""
+        timestamps, values = self.arrays()
+        i = bisect_right(timestamps, timestamp)
+        timestamps.insert(i, timestamp)
+        values.insert(i, value)
+        capacity = len(self._values)
+        self._size = min(len(values), capacity)
+        self._timestamps[:self._size] = timestamps[-capacity:]
+        self._values[:self._size] = values[-capacity:]
+        self._next = self._size % capacity
+
+    def arrays(self):
+        """Return timestamps and values, oldest first."""
+        if self._size < len(self._values):
+            return (self._timestamps[:self._size],
+                    self._values[:self._size])
+        return (self._timestamps[self._next:] + self._timestamps[:self._next],
+                self._values[self._next:] + self._values[:self._next])
+
+
+class SensorHistory:
+    """Recent readings of sensor items, in ring buffers of fixed size.
+    Queries use numpy when installed, and plain Python otherwise."""
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        self._buffer_size = size
+        self._buffers = {}
+        self._lock = Lock()
+        try:
+            # pylint: disable=import-outside-toplevel
+            import numpy
+            self._numpy = numpy
+        except ImportError:
+            self._numpy = None
+
+    def record(self, device_id, values, timestamp=None):
+        """Add readings of a sensor, values by (name, scale)."""
+        timestamp = timestamp or time()
+        with self._lock:
+            for (name, scale), value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                key = (device_id, name, scale)
+                buffer = self._buffers.get(key)
+                if buffer is None:
+                    buffer = self._buffers[key] = _RingBuffer(
+                        self._buffer_size)
+                buffer.append(timestamp, value)
+
+    def keys(self):
+        """(sensor id, name, scale) of recorded sensor items."""
+        with self._lock:
+            return list(self._buffers)
+
+    def readings(self, device_id, name, scale, window=None, now=None):
+        """Return timestamps and values of a sensor item, oldest first,
+        restricted to the last window seconds if given."""
+        with self._lock:
+            buffer = self._buffers.get((device_id, name, _scale(scale)))
+            timestamps, values = buffer.arrays() if buffer else ((), ())
+        if self._numpy:
+            timestamps = self._numpy.frombuffer(timestamps or b'')
+            values = self._numpy.frombuffer(values or b'')
+            if window is not None:
+                mask = timestamps >= (now or time()) - window
+                timestamps, values = timestamps[mask], values[mask]
+            return timestamps, values
+        if window is not None:
+            since = (now or time()) - window
+            pairs = [(t, v) for t, v in zip(timestamps, values) if t >= since]
+            return [t for t, _ in pairs], [v for _, v in pairs]
+        return list(timestamps), list(values)
+
+    def min(self, device_id, name, scale, window=None):
+        """Lowest value, None if no readings."""
+        _, values = self.readings(device_id, name, scale, window)
+        if not len(values):
+            return None
+        return float(values.min() if self._numpy else min(values))
+
+    def max(self, device_id, name, scale, window=None):
+        """Highest value, None if no readings."""
+        _, values = self.readings(device_id, name, scale, window)
+        if not len(values):
+            return None
+        return float(values.max() if self._numpy else max(values))
+
+    def mean(self, device_id, name, scale, window=None):
+        """Average value, None if no readings."""
+        _, values = self.readings(device_id, name, scale, window)
+        if not len(values):
+            return None
+        if self._numpy:
+            return float(values.mean())
+        return sum(values) / len(values)
+
+    def rate(self, device_id, name, scale, window=None):
+        """Rate of change per second (least squares slope),
+        None if less than two readings."""
+        timestamps, values = self.readings(device_id, name, scale, window)
+        if len(values) < 2:
+            return None
+        if self._numpy:
+            t = timestamps - timestamps.mean()
+            denominator = float((t * t).sum())
+            return (float((t * (values - values.mean())).sum()) /
+                    denominator) if denominator else None
+        t_mean = sum(timestamps) / len(timestamps)
+        v_mean = sum(values) / len(values)
+        denominator = sum((t - t_mean) ** 2 for t in timestamps)
+        return (sum((t - t_mean) * (v - v_mean)
+                    for t, v in zip(timestamps, values)) /
+                denominator) if denominator else None
+
+    def downsample(self, device_id, name, scale, interval, window=None):
+        """Average values in buckets of interval seconds.
+        Returns list of (start of bucket, mean value)."""
+        timestamps, values = self.readings(device_id, name, scale, window)
+        if not len(values):
+            return []
+        if self._numpy:
+            np = self._numpy
+            buckets = (timestamps // interval).astype(np.int64)
+            first = int(buckets.min())
+            buckets -= first
+            counts = np.bincount(buckets)
+            sums = np.bincount(buckets, weights=values)
+            return [(float((first + i) * interval), float(sums[i] / counts[i]))
+                    for i in np.nonzero(counts)[0]]
+        sums = {}
+        for t, v in zip(timestamps, values):
+            total, count = sums.get(t // interval, (0.0, 0))
+            sums[t // interval] = (total + v, count + 1)
+        return [(bucket * interval, total / count)
+                for bucket, (total, count) in sorted(sums.items())]
+
+
 class DefaultCallbackDispatcher(object):
     def __init__(self):
         super(DefaultCallbackDispatcher, self).__init__()
@@ -362,7 +1311,618 @@ class AsyncioCallbackDispatcher(object):
         self._loop.call_soon_threadsafe(callback, *args)
 
 
-class Session:
+class _APIError(OSError):
+    """Error reported in the response from the API."""
+
+
+def _retryable(error):
+    """Return true if a failed request may succeed if retried."""
+    if isinstance(error, (_APIError, ValueError)):
+        return False
+    status = (getattr(getattr(error, 'response', None), 'status_code', None) or
+              getattr(error.__cause__, 'status', None))
+    return status is None or status >= 500 or status == 429
+
+
+class _TokenBucket:
+    """Token bucket whose rate backs off on errors (AIMD)."""
+
+    __slots__ = ('rate', 'configured', 'capacity', 'tokens', 'stamp',
+                 'backoff', 'until')
+
+    def __init__(self, rate, capacity):
+        self.rate = self.configured = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.stamp = monotonic()
+        self.backoff = 0.0
+        self.until = 0.0
+
+    def delay(self, now):
+        """Seconds until a token is available."""
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return max(self.until - now,
+                   (1 - self.tokens) / self.rate if self.tokens < 1 else 0,
+                   0)
+
+    def take(self):
+        """Consume a token."""
+        self.tokens -= 1
+
+    def failed(self, now, max_backoff):
+        """Halve rate and pause, doubling the pause each time."""
+        self.rate = max(self.configured / 16, self.rate / 2)
+        self.backoff = min(max_backoff, self.backoff * 2 or 0.5)
+        self.until = now + self.backoff
+
+    def succeeded(self):
+        """Increase rate towards configured rate."""
+        self.rate = min(self.configured, self.rate + self.configured / 10)
+        self.backoff = 0.0
+
+
+class RateLimiter:
+    """Client side rate limiting of API requests.
+
+    Requests are limited by a token bucket per class of endpoint (list,
+    info, command) and optionally by one for all requests, with waiting
+    requests served in order of priority: commands, then info, then
+    list. Rates are halved and requests paused on errors and timeouts,
+    and recover gradually on success. Failed requests, except for
+    errors reported by the API, are retried up to retries times."""
+
+    PRIORITIES = {'command': 0, 'info': 1, 'list': 2}
+
+    def __init__(self, rates=None, burst=None, total=None, retries=2,
+                 max_backoff=30):
+        rates = dict(DEFAULT_RATES, **(rates or {}))
+        burst = burst or {}
+        self._buckets = {cls: _TokenBucket(rate, burst.get(cls,
+                                                           max(1, rate)))
+                         for cls, rate in rates.items()}
+        self._total = _TokenBucket(total, max(1, total)) if total else None
+        self.retries = retries
+        self._max_backoff = max_backoff
+        self._cond = Condition()
+        self._waiters = []
+        self._sequence = count()
+
+    @staticmethod
+    def endpoint_class(path):
+        """Class of endpoint: list, info or command."""
+        if path.endswith('/list'):
+            return 'list'
+        if path.startswith('device/') and path != 'device/info':
+            return 'command'
+        return 'info'
+
+    def _waiter(self, path):
+        cls = self.endpoint_class(path)
+        waiter = (self.PRIORITIES[cls], next(self._sequence), cls)
+        insort(self._waiters, waiter)
+        return waiter
+
+    def _grant(self, waiter):
+        """Take tokens for waiter if it is first in line.
+        Returns 0 if granted, else seconds to wait."""
+        now = monotonic()
+        total = self._total.delay(now) if self._total else 0
+        for other in self._waiters:
+            delay = self._buckets[other[2]].delay(now)
+            if other is waiter:
+                delay = max(delay, total)
+                if not delay:
+                    self._buckets[waiter[2]].take()
+                    if self._total:
+                        self._total.take()
+                    self._waiters.remove(waiter)
+                    self._cond.notify_all()
+                return delay
+            if not delay:
+                # a request before us in line can go first
+                return max(total, 0.001)
+
+    def acquire(self, path):
+        """Block until a request to path may be sent."""
+        with self._cond:
+            waiter = self._waiter(path)
+            try:
+                while True:
+                    delay = self._grant(waiter)
+                    if not delay:
+                        return
+                    self._cond.wait(delay)
+            except BaseException:
+                self._waiters.remove(waiter)
+                raise
+
+    async def acquire_async(self, path):
+        """Wait until a request to path may be sent."""
+        with self._cond:
+            waiter = self._waiter(path)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._grant(waiter)
+                if not delay:
+                    return
+                await asyncio.sleep(min(delay, 0.1))
+        except BaseException:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+
+    def feedback(self, path, error=None):
+        """Adapt rate of endpoint class to outcome of a request."""
+        bucket = self._buckets[self.endpoint_class(path)]
+        with self._cond:
+            if error is None or not _retryable(error):
+                bucket.succeeded()
+            else:
+                _LOGGER.debug('Backing off %s requests',
+                              self.endpoint_class(path))
+                bucket.failed(monotonic(), self._max_backoff)
+                if self._total:
+                    self._total.failed(monotonic(), self._max_backoff)
+            self._cond.notify_all()
+
+
+class BatchingCallbackDispatcher(object):
+    """Dispatcher with a bounded buffer, delivering callbacks in batches.
+    Callbacks are run on a worker thread, or on the thread running the
+    event loop if one is given, so a slow consumer never stalls the
+    listener. Pending callbacks for the same device (or the same field
+    of a device, for change events) are coalesced into one. When the
+    buffer is full, the overflow policy decides whether to drop the
+    oldest or the newest entry, or to block the producer.
+    """
+
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    BLOCK = 'block'
+
+    def __init__(self, maxsize=1000, batch_size=100,
+                 overflow=DROP_OLDEST, loop=None):
+        super(BatchingCallbackDispatcher, self).__init__()
+        if overflow not in (self.DROP_OLDEST, self.DROP_NEWEST, self.BLOCK):
+            raise ValueError('Unknown overflow policy %s' % overflow)
+        self._maxsize = maxsize
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._loop = loop
+        self._pending = OrderedDict()
+        self._cond = Condition()
+        self._thread = None
+        self._running = True
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+    @property
+    def queue_depth(self):
+        """Number of callbacks waiting for delivery."""
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        """Counters for monitoring."""
+        with self._cond:
+            return dict(queue_depth=len(self._pending),
+                        delivered=self.delivered,
+                        coalesced=self.coalesced,
+                        dropped=self.dropped,
+                        batches=self.batches,
+                        errors=self.errors)
+
+    @staticmethod
+    def _key(callback, args):
+        """Callbacks with the same key are coalesced."""
+        arg = args[0] if len(args) == 1 else None
+        if isinstance(arg, ChangeEvent):
+            return callback, arg.device_id, arg.field
+        if isinstance(arg, dict) and 'id' in arg:
+            # sensors and switches number their ids separately
+            return callback, '_' * ('data' in arg) + str(arg['id'])
+        return callback, object()
+
+    def on_callback(self, callback, *args):
+        key = self._key(callback, args)
+        with self._cond:
+            if key in self._pending:
+                _, old_args = self._pending[key]
+                if isinstance(args[0], ChangeEvent):
+                    # keep the value from before the first pending change
+                    args = (args[0]._replace(old=old_args[0].old),)
+                self._pending[key] = (callback, args)
+                self.coalesced += 1
+                return
+            while len(self._pending) >= self._maxsize:
+                if self._overflow == self.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self._overflow == self.DROP_OLDEST:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                else:
+                    self._cond.wait()
+            self._pending[key] = (callback, args)
+            if not self._thread:
+                self._thread = Thread(target=self._run,
+                                      name='tellduslive-dispatcher',
+                                      daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _deliver(self, batch):
+        """Run a batch of callbacks."""
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Callback failed')
+                self.errors += 1
+
+    async def _deliver_async(self, batch):
+        self._deliver(batch)
+
+    def _run(self):
+        """Worker thread."""
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = [self._pending.popitem(last=False)[1]
+                         for _ in range(min(self._batch_size,
+                                            len(self._pending)))]
+                self._cond.notify_all()
+            if self._loop:
+                asyncio.run_coroutine_threadsafe(
+                    self._deliver_async(batch), self._loop).result()
+            else:
+                self._deliver(batch)
+            with self._cond:
+                self.delivered += len(batch)
+                self.batches += 1
+
+    def stop(self, timeout=None):
+        """Deliver pending callbacks and stop the worker thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class BaseSession:
+    """State shared by the blocking and the asyncio sessions.
+
+    The state is copy-on-write: writers build a new dict while holding
+    the lock (never across network I/O) and then swap it in, so readers
+    always see a consistent snapshot without locking."""
+
+    def __init__(self, on_change=None, callback_dispatcher=None,
+                 metrics=None, history=None):
+        self._state = {}
+        # bumped whenever the state changes, swapped or in place
+        self._version = 0
+        self._lock = RLock()
+        self._metrics = metrics or Instrumentation()
+        # device id -> reused Device wrapper
+        self._wrappers = {}
+        # sensor id -> (name, scale) -> parsed value
+        self._values = {}
+        # device id -> coalescer of commands
+        self._coalescers = {}
+        self._history = history
+        self._on_change = on_change
+        self._callback_dispatcher = (callback_dispatcher or
+                                     DefaultCallbackDispatcher())
+        # (protocol, model, sensorId) -> id of sensor
+        self._sensor_index = {}
+        # (house, unit) -> id of device
+        self._switch_index = {}
+
+    @property
+    def metrics(self):
+        """Instrumentation of this session."""
+        return self._metrics
+
+    def _locked(self, name):
+        """Session lock, timed if instrumentation is enabled."""
+        return (_TimedLock(self._lock, self._metrics, name)
+                if self._metrics.enabled else self._lock)
+
+    def _device(self, device_id):
+        """Return the raw representaion of a device."""
+        return self._state.get(device_id)
+
+    @staticmethod
+    def _sensor_key(device):
+        """Key identifying a sensor in asynchronous packets."""
+        return (device.get('protocol'),
+                device.get('model'),
+                str(device.get('sensorId')))
+
+    @staticmethod
+    def _switch_key(device):
+        """Key identifying a switch in asynchronous packets."""
+        parameters = {param.get('name'): param.get('value')
+                      for param in device.get('parameters') or []}
+        return (parameters.get('house'),
+                parameters.get('unit'))
+
+    @staticmethod
+    def _compact(device):
+        """Share the strings repeated across devices and sensors."""
+        for field in ('protocol', 'model', 'client_id'):
+            if isinstance(device.get(field), str):
+                device[field] = intern(device[field])
+        for item in chain(device.get('data') or (),
+                          device.get('parameters') or ()):
+            for field in ('name', 'scale'):
+                if isinstance(item.get(field), str):
+                    item[field] = intern(item[field])
+
+    def _store(self, state, device_id, device):
+        """Store raw device in state being built,
+        keeping the packet lookup indexes current."""
+        self._compact(device)
+        if device_id.startswith('_'):
+            index, key = self._sensor_index, self._sensor_key
+        else:
+            index, key = self._switch_index, self._switch_key
+        old = state.get(device_id)
+        if old is not None and index.get(key(old)) == device_id:
+            del index[key(old)]
+        if key(device) != (None, None):
+            index[key(device)] = device_id
+        if 'data' in device:
+            self._index_values(device_id, device['data'],
+                               device.get('lastUpdated'))
+        state[device_id] = device
+
+    def _index_values(self, device_id, data, timestamp=None):
+        """Index parsed values of sensor data by (name, scale).
+        Values equal to the last ones are not recorded again, e.g. when
+        a poll reports a reading already heard in a packet."""
+        values = {(item.get('name'), _scale(item.get('scale'))):
+                  _number(item.get('value'))
+                  for item in data or ()}
+        previous = self._values.get(device_id)
+        self._values[device_id] = values
+        if self._history is not None and values != previous:
+            self._history.record(device_id, values, timestamp)
+
+    @property
+    def history(self):
+        """SensorHistory fed by this session, if any."""
+        return self._history
+
+    def _diff(self, device_id, old, new):
+        """Return change events between two raw representations."""
+        if not self._on_change:
+            return []
+        old = old or {}
+        timestamp = time()
+        return [ChangeEvent(device_id, field, old.get(field),
+                            new[field], timestamp)
+                for field in WATCHED_FIELDS
+                if field in new and old.get(field) != new[field]]
+
+    def _emit(self, events):
+        """Deliver change events. Must not be called with lock held."""
+        for event in events:
+            self._callback_dispatcher.on_callback(self._on_change, event)
+
+    def _merge(self, devices):
+        """Swap in a new state with raw devices (by id) merged.
+        Returns change events."""
+        with self._locked('merge'):
+            state = dict(self._state)
+            events = []
+            for device_id, device in devices.items():
+                events.extend(self._diff(device_id,
+                                         state.get(device_id),
+                                         device))
+                self._store(state, device_id, device)
+            self._state = state
+            self._version += 1
+        return events
+
+    def _apply(self, device_id, device, fields):
+        """Update fields of raw device in place. Returns change events."""
+        with self._locked('apply'):
+            events = self._diff(device_id, device, fields)
+            device.update(fields)
+            if 'data' in fields:
+                self._index_values(device_id, fields['data'])
+            self._version += 1
+        return events
+
+    def values(self):
+        """Return parsed values of all sensors, as a dict from
+        sensor id to dict from (name, scale) to value."""
+        return dict(self._values)
+
+    def _update_device(self, device_id, **fields):
+        """Update fields of a known device."""
+        device = self._device(device_id)
+        if device is not None:
+            self._emit(self._apply(device_id, device, fields))
+
+    def _collect(self, devices, is_sensor=False):
+        """Update local state.
+        N.B. We prefix sensors with '_',
+        since apparently sensors and devices
+        do not share name space and there can
+        be collissions.
+        FIXME: Remove this hack."""
+        self._emit(self._merge({'_' * is_sensor + str(device['id']): device
+                                for device in devices or {}
+                                if device['name'] and
+                                not (is_sensor and
+                                     'data' not in device)}))
+
+    def _collect_changed(self, sensors):
+        """Update local state with sensors that changed since last poll,
+        judged by lastUpdated (or data, if not reported).
+        Returns set of ids of changed sensors."""
+        changed = {}
+        for sensor in sensors or {}:
+            if not sensor['name'] or 'data' not in sensor:
+                continue
+            device_id = '_' + str(sensor['id'])
+            old = self._state.get(device_id)
+            if (old is None or
+                    old.get('lastUpdated') != sensor.get('lastUpdated') or
+                    (sensor.get('lastUpdated') is None and
+                     old.get('data') != sensor['data'])):
+                changed[device_id] = sensor
+        if changed:
+            self._emit(self._merge(changed))
+        return set(changed)
+
+    def save_state(self, path):
+        """Atomically write known devices and sensors to a cache file."""
+        state = {device_id: {field: device[field]
+                             for field in CACHED_FIELDS
+                             if field in device}
+                 for device_id, device in self._state.items()}
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp = None
+        try:
+            fd, tmp = mkstemp(prefix='.tellduslive-', dir=directory)
+            with os.fdopen(fd, 'w') as cache:
+                json.dump({'version': STATE_CACHE_VERSION,
+                           'state': state},
+                          cache, separators=(',', ':'))
+            os.replace(tmp, path)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            _LOGGER.warning('Failed to save state to %s: %s', path, e)
+            if tmp and os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def load_state(self, path):
+        """Load devices and sensors from a cache file.
+        Returns true if anything was loaded."""
+        try:
+            with open(path) as cache:
+                cached = json.load(cache)
+            if cached.get('version') != STATE_CACHE_VERSION:
+                _LOGGER.info('Ignoring state cache %s of other version',
+                             path)
+                return False
+            self._merge(cached['state'])
+            _LOGGER.debug('Loaded %d devices from %s',
+                          len(cached['state']), path)
+            return bool(cached['state'])
+        except FileNotFoundError:
+            return False
+        except (OSError, KeyError, AttributeError, ValueError) as e:
+            _LOGGER.warning('Failed to load state from %s: %s', path, e)
+            return False
+
+    def _new_device_ids(self, devices):
+        """Ids in a devices/list response that need a device/info lookup:
+        new devices, and devices whose lookup failed before."""
+        state = self._state
+        return [d.get('id') for d in devices or []
+                if not (state.get(d.get('id')) or {}).get('protocol')]
+
+    @staticmethod
+    def _infos_received(infos):
+        """Return true if all device/info lookups succeeded."""
+        return all(info is not None for info in infos.values())
+
+    def _merge_device_infos(self, devices, infos):
+        """Add protocol, model and parameters to a devices/list response,
+        either from known state or from device/info responses."""
+        for d in devices or []:
+            if infos.get(d.get('id')) is not None:
+                _LOGGER.debug("Got protocol and parameters "
+                              "for new device %s", d.get('id'))
+                req_dev = infos.get(d.get('id')) or {}
+                d.update({'parameters': req_dev.get('parameter'),
+                          'protocol': req_dev.get('protocol'),
+                          'model': req_dev.get('model'),
+                          'client_id': req_dev.get('client')})
+            else:
+                _LOGGER.debug("already known device")
+                req_dev = self._device(d.get('id')) or {}
+                d.update({'parameters': req_dev.get('parameters'),
+                          'protocol': req_dev.get('protocol'),
+                          'model': req_dev.get('model'),
+                          'client_id': req_dev.get('client_id')})
+
+    def _new_device(self, device_id):
+        """Create wrapper for device."""
+        return Device(self, device_id)
+
+    def _batch(self, commands, force):
+        """Resolve a batch of (device or id, command, params) to
+        results of commands skipped as no-ops, and commands to send.
+        Only the last command for each device is kept."""
+        batch = OrderedDict()
+        for device, command, params in commands:
+            if command not in COMMANDS:
+                raise ValueError('Unsupported command {}'.format(command))
+            if command == DIM:
+                try:
+                    int((params or {})['level'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError('Invalid dim level {!r}'.format(
+                        (params or {}).get('level'))) from None
+            if not isinstance(device, Device):
+                device = self.device(str(device))
+            batch[device.device_id] = (device, command, params or {})
+        results = {}
+        todo = []
+        for device_id, (device, command, params) in batch.items():
+            if not force and device.is_noop(command, **params):
+                _LOGGER.debug('Skipping %s of %s, already in state',
+                              METHODS[command], device_id)
+                results[device_id] = None
+            else:
+                todo.append((device, command, params))
+        return results, todo
+
+    def device(self, device_id):
+        """Return a device object."""
+        wrapper = self._wrappers.get(device_id)
+        if wrapper is None:
+            wrapper = self._new_device(device_id)
+            if device_id in self._state:
+                wrapper = self._wrappers.setdefault(device_id, wrapper)
+        return wrapper
+
+    @property
+    def sensors(self):
+        """Return only sensors.
+        FIXME: terminology device vs device."""
+        return (device
+                for device in self.devices
+                if device.is_sensor)
+
+    @property
+    def devices(self):
+        """Request representations of all devices."""
+        return (self.device(device_id) for device_id in self.device_ids)
+
+    @property
+    def device_ids(self):
+        """List of known device ids."""
+        return self._state.keys()
+
+
+class Session(BaseSession):
     """Tellduslive session."""
 
     # pylint: disable=too-many-arguments
@@ -376,12 +1936,17 @@ class Session:
                  listen=False,  # listen for local UDP broadcasts
                  callback=None,  # callback for asynchrounous sensor updates
                  config=None,  # config for localUDPSession and async_listner
-                 callback_dispatcher=None):
-
-        if callback_dispatcher:
-            self._callback_dispatcher = callback_dispatcher
-        else:
-            self._callback_dispatcher = DefaultCallbackDispatcher()
+                 callback_dispatcher=None,
+                 workers=DEFAULT_WORKERS,  # max concurrent requests
+                 on_change=None,  # callback for ChangeEvents
+                 dedup_window=DEDUP_WINDOW,
+                 state_file=None,  # cache of state for fast startup
+                 metrics=None,  # Instrumentation, e.g. Metrics()
+                 history=None,  # SensorHistory to record readings in
+                 rate_limiter=None,  # RateLimiter for requests
+                 local_token=None,  # with host and Live keys: hybrid
+                 executor=None,  # shared ThreadPoolExecutor
+                 decoder=None):  # JSON loads, e.g. fast_decoder()
 
         _LOGGER.info('%s version %s', __name__, __version__)
         if not(all([public_key,
@@ -393,8 +1958,18 @@ class Session:
                all([host, listen])):
             raise ValueError('Missing configuration')
 
-        self._state = {}
-        self._lock = RLock()
+        super().__init__(on_change, callback_dispatcher, metrics, history)
+        self._rate_limiter = rate_limiter
+        self._loads = decoder
+        self._workers = workers
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._dedup_window = dedup_window.total_seconds()
+        # packet key -> (payload, timestamp) of last packet
+        self._last_packets = {}
+        self._state_file = state_file
+        self._registered = set()
+        warm = state_file and self.load_state(state_file)
         if listen:
             from tellsticknet import devicemanager
             self._devicemanager = devicemanager.Tellstick(host=host,
@@ -406,120 +1981,151 @@ class Session:
                         else None)
 
         self._session = (
-            LocalAPISession(host,
-                            application,
-                            token) if host and token and not public_key else
-            LiveAPISession(public_key,
-                           private_key,
-                           token,
-                           token_secret,
-                           application) if (public_key and
-                                            private_key and
-                                            token and
-                                            token_secret) else
+            HybridAPISession(_transport('LocalAPISession')(host,
+                                                           application,
+                                                           local_token),
+                             _transport('LiveAPISession')(public_key,
+                                                          private_key,
+                                                          token,
+                                                          token_secret,
+                                                          application))
+            if host and local_token and public_key else
+            _transport('LocalAPISession')(host,
+                                          application,
+                                          token)
+            if host and token and not public_key else
+            _transport('LiveAPISession')(public_key,
+                                         private_key,
+                                         token,
+                                         token_secret,
+                                         application)
+            if public_key and private_key and token and token_secret else
             LocalUDPSession(self._devicemanager))
 
         if listen:
             _LOGGER.debug("Callback functions is: %s", callback)
-            self.update()
-            for d in self.devices:
-                if not d.is_sensor:
-                    self._devicemanager.adddevice({'name': d.name,
-                                                   'id': d.device_id,
-                                                   'parameters': d.parameters,
-                                                   'protocol': d.protocol,
-                                                   'model': d.model,
-                                                   'client_id': d.client_id})
+            if warm:
+                # serve cached state at once, refresh in background, on a
+                # thread of its own since update() waits on the executor
+                self._register_devices()
+                Thread(target=self._refresh_and_register,
+                       name='tellduslive-refresh', daemon=True).start()
+            else:
+                self._refresh_and_register()
             self._setup_async_listener(self._devicemanager, callback)
 
+    def _refresh_and_register(self):
+        """Update from server and register new devices with the listener."""
+        self.update()
+        self._register_devices()
+
+    def _register_devices(self):
+        """Make devices known to the local device manager."""
+        for d in self.devices:
+            if not d.is_sensor and d.device_id not in self._registered:
+                self._registered.add(d.device_id)
+                self._devicemanager.adddevice({'name': d.name,
+                                               'id': d.device_id,
+                                               'parameters': d.parameters,
+                                               'protocol': d.protocol,
+                                               'model': d.model,
+                                               'client_id': d.client_id})
+
     def _setup_async_listener(self, devicemanager, callback):
         """Starts listening for asynchronous UDP packets on the
         local network. If host is None, autodiscovery will be used."""
         def got(device):
             """Callback when ascynhronous packet is received.
             N.B. will be called in another thread."""
-            local_id = ()
-            with self._lock:
-                callbackdevice = None
-                """ check i device is a sensor """
-                if 'sensorId' in device:
-                    local_id = (device['protocol'],
-                                device['model'],
-                                str(device['sensorId']))
-                    _LOGGER.debug('Received asynchronous packet %s:%s:%s',
-                                  *local_id)
-                    _LOGGER.debug('Received asynchronous data %s from %s',
-                                  device['data'], local_id)
-
-                    sensor = next((sensor
-                                   for sensor in self.sensors
-                                   if ((sensor.protocol,
-                                        sensor.model,
-                                        str(sensor.sensorId)) == local_id)),
-                                  None)
-
-                    if not sensor:
-                        _LOGGER.info('Found no corresponding device on server'
-                                     'for packet %s:%s:%s %s', *local_id,
-                                     'new sensor added')
-                        self._state.update({'_' + str(device['id']): device})
-
-                        sensor = next((sensor
-                                       for sensor in self.sensors
-                                       if ((sensor.protocol,
-                                            sensor.model,
-                                            str(sensor.sensorId)
-                                            ) == local_id)),
-                                      None)
-
-                    _LOGGER.debug('Got asynchronous update from sensor %s',
-                                  sensor.name)
-
-                    sensor.device.update({"data": device['data']})
-                    callbackdevice = sensor.device
-                else:
-                    for param in device.get('parameters'):
-                        if param.get('name') == 'unit':
-                            unit = param.get('value')
-                        elif param.get('name') == 'house':
-                            house = param.get('value')
-                    local_id = (house, unit)
-                    _LOGGER.debug('Received asynchronous data %s from %s',
-                                  device, local_id)
-                    for dev in self.devices:
-                        if dev.parameters:
-                            for param in dev.parameters:
-                                if param.get('name') == 'unit':
-                                    unit = param.get('value')
-                                elif param.get('name') == 'house':
-                                    house = param.get('value')
-                            device_id = (house, unit)
-                            if device_id == local_id:
-                                _LOGGER.debug('Found device %s from %s',
-                                              dev.device, device_id)
-                                break
-                    if not dev:
-                        _LOGGER.info('Found no corresponding device on server'
-                                     'for packet %s %s', local_id,
-                                     'new device  added')
-                        self._state.update({str(device['id']): device})
-
-                        dev = next((dev
-                                    for dev in self.devices
-                                    if (dev.device_id == device['id'])), None)
-
-                    _LOGGER.debug('Got asynchronous update from device %s',
-                                  dev.name)
-                    dev.device.update({'state': device.get('state')})
-                    callbackdevice = dev.device
-                _LOGGER.debug("callback device id %s",
-                              callbackdevice.get('id'))
-                self._callback_dispatcher.on_callback(callback,
-                                                      callbackdevice)
+            self._got(device, callback)
 
         _LOGGER.info('Starting asynchronous listener thread')
         devicemanager.async_listen(callback=got)
 
+    def _duplicate(self, device):
+        """Return true if the same packet was received recently."""
+        if 'sensorId' in device:
+            key = self._sensor_key(device)
+            payload = device.get('data')
+        else:
+            key = self._switch_key(device)
+            payload = (device.get('state'), device.get('statevalue'))
+        now = time()
+        with self._lock:
+            last = self._last_packets.get(key)
+            self._last_packets[key] = (payload, now)
+        return (last is not None and
+                last[0] == payload and
+                now - last[1] < self._dedup_window)
+
+    def _got(self, device, callback):
+        """Merge an asynchronous packet into local state."""
+        with self._metrics.timed('packet'):
+            self._got_packet(device, callback)
+
+    def _got_packet(self, device, callback):
+        """Merge an asynchronous packet, then notify."""
+        if self._duplicate(device):
+            _LOGGER.debug('Dropping duplicate packet %s', device)
+            return
+        with self._locked('packet'):
+            if 'sensorId' in device:
+                device_id, events = self._got_sensor(device)
+                fields = {'data': device['data']}
+            else:
+                device_id, events = self._got_switch(device)
+                fields = {'state': device.get('state')}
+            callbackdevice = self._state[device_id]
+            events.extend(self._apply(device_id, callbackdevice, fields))
+        self._emit(events)
+        _LOGGER.debug("callback device id %s",
+                      callbackdevice.get('id'))
+        if callback:
+            self._callback_dispatcher.on_callback(callback,
+                                                  callbackdevice)
+
+    def _got_sensor(self, device):
+        """Find sensor of packet, adding it if unknown.
+        Returns id of sensor and change events."""
+        local_id = self._sensor_key(device)
+        _LOGGER.debug('Received asynchronous packet %s:%s:%s',
+                      *local_id)
+        _LOGGER.debug('Received asynchronous data %s from %s',
+                      device['data'], local_id)
+
+        device_id = self._sensor_index.get(local_id)
+        events = []
+        if device_id is None:
+            _LOGGER.info('Found no corresponding device on server '
+                         'for packet %s:%s:%s %s', *local_id,
+                         'new sensor added')
+            device_id = '_' + str(device['id'])
+            events = self._merge({device_id: device})
+
+        _LOGGER.debug('Got asynchronous update from sensor %s',
+                      self._state[device_id].get('name'))
+        return device_id, events
+
+    def _got_switch(self, device):
+        """Find switch of packet, adding it if unknown.
+        Returns id of switch and change events."""
+        local_id = self._switch_key(device)
+        _LOGGER.debug('Received asynchronous data %s from %s',
+                      device, local_id)
+
+        device_id = self._switch_index.get(local_id)
+        events = []
+        if device_id is None:
+            _LOGGER.info('Found no corresponding device on server '
+                         'for packet %s %s', local_id,
+                         'new device added')
+            device_id = str(device['id'])
+            events = self._merge({device_id: device})
+
+        _LOGGER.debug('Got asynchronous update from device %s',
+                      self._state[device_id].get('name'))
+        return device_id, events
+
     @property
     def authorize_url(self):
         """Retrieve URL for authorization."""
@@ -544,35 +2150,70 @@ class Session:
         """Return the token secret."""
         return self._session.access_token_secret
 
-    def _device(self, device_id):
-        """Return the raw representaion of a device."""
-        with self._lock:
-            return self._state.get(device_id)
-
     def _request(self, path, **params):
-        """Send a request to the Tellstick Live API."""
+        """Send a request to the Tellstick Live API,
+        rate limited and retried if there is a rate limiter."""
+        limiter = self._rate_limiter
+        if not limiter:
+            return self._request_once(path, **params)[0]
+        for attempt in range(limiter.retries + 1):
+            limiter.acquire(path)
+            result, error = self._request_once(path, **params)
+            limiter.feedback(path, error)
+            if not error or not _retryable(error):
+                break
+            _LOGGER.debug('Retrying %s, attempt %d', path, attempt + 1)
+        return result
+
+    def _request_once(self, path, **params):
+        """Send a request to the Tellstick Live API.
+        Returns result and error."""
+        start = monotonic()
+        nbytes = 0
         try:
             self._session.maybe_refresh_token()
             url = urljoin(self._session.url, path)
             _LOGGER.debug('Request %s %s', url, params)
+            streams = getattr(self._session, 'streams', False)
+            # stream list endpoints, unless decoding with another library
+            key = (LIST_KEYS.get(path)
+                   if streams and not self._loads else None)
             response = self._session.get(url,
                                          params=params,
-                                         timeout=TIMEOUT.seconds)
-            response.raise_for_status()
+                                         timeout=TIMEOUT.seconds,
+                                         **({'stream': True} if key else {}))
+            try:
+                response.raise_for_status()
+                if key:
+                    nbytes, result = _stream_list(
+                        response.iter_content(STREAM_CHUNK), key)
+                elif streams:
+                    nbytes = len(response.content)
+                    result = _decode(response.content, path, self._loads)
+                else:
+                    nbytes = len(getattr(response, 'content', b''))
+                    result = response.json()
+            finally:
+                if key:
+                    response.close()
             _LOGGER.debug('Response %s %s %s',
                           response.status_code,
                           response.headers['content-type'],
-                          response.json())
-            response = response.json()
-            if 'error' in response:
-                raise OSError(response['error'])
-            return response
-        except OSError as error:
+                          result)
+            if 'error' in result:
+                raise _APIError(result['error'])
+            self._metrics.request(path, monotonic() - start,
+                                  nbytes, _count_items(result))
+            return result, None
+        except (OSError, ValueError) as error:
             _LOGGER.warning('Failed request: %s', error)
+            self._metrics.request(path, monotonic() - start,
+                                  nbytes, 0, _error_kind(error))
+            return None, error
 
     def execute(self, method, **params):
         """Make request, check result if successful."""
-        with self._lock:
+        with self._metrics.timed('execute'):
             response = self._request(method, **params)
             return response and response.get('status') == 'success'
 
@@ -603,79 +2244,943 @@ class Session:
                             includeIgnored=0)
         return res.get('sensor') if res else None
 
+    def _request_sensor_history(self, id, start, end):
+        """Request readings of sensor in time range from server."""
+        res = self._request('sensor/history',
+                            id=id,
+                            includeKey=0,
+                            **{'from': start, 'to': end})
+        if res is None:
+            raise OSError('Failed to fetch history of sensor {} '
+                          'from {} to {}'.format(id, start, end))
+        return _readings('_' + str(id), res.get('history'))
+
+    def sensor_history(self, device_id, start, end=None,
+                       chunk=HISTORY_CHUNK, workers=None):
+        """Generate Readings of a sensor in a time range, oldest first.
+        The range is fetched in chunks, with at most workers
+        (default: the session's) requests in flight, so memory use
+        does not grow with the length of the range.
+        Raises OSError if a chunk can not be fetched."""
+        pending = deque()
+        ranges = _chunks(start, end, chunk)
+        workers = workers or self._workers
+        try:
+            while True:
+                while len(pending) < workers:
+                    chunk_range = next(ranges, None)
+                    if not chunk_range:
+                        break
+                    pending.append(self.executor.submit(
+                        self._request_sensor_history,
+                        str(device_id).lstrip('_'), *chunk_range))
+                if not pending:
+                    return
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @property
+    def executor(self):
+        """Thread pool used for concurrent requests."""
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._workers,
+                    thread_name_prefix='tellduslive')
+                self._owns_executor = True
+            return self._executor
+
+    def close(self):
+        """Save state, if cached, and release the thread pool."""
+        if self._state_file:
+            self.save_state(self._state_file)
+        if hasattr(self._session, 'close'):
+            self._session.close()
+        with self._lock:
+            if self._executor and self._owns_executor:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def execute_batch(self, commands, parallelism=None, force=False):
+        """Send commands to many devices concurrently.
+        commands are (device or device id, command, params) where command
+        is one of TURNON, TURNOFF, DIM, UP, DOWN, STOP and params a dict
+        (e.g. dict(level=128) for DIM) or None. Commands that would not
+        change the known state are skipped, unless force is true.
+        At most parallelism (default: the session's workers) commands
+        are in flight. Returns dict from device id to True if successful,
+        False if failed, None if skipped."""
+        results, todo = self._batch(commands, force)
+
+        def run(entry):
+            device, command, params = entry
+            return bool(getattr(device, COMMANDS[command])(**params))
+
+        if parallelism:
+            with ThreadPoolExecutor(max_workers=parallelism) as pool:
+                outcomes = list(pool.map(run, todo))
+        else:
+            outcomes = list(self.executor.map(run, todo))
+        results.update((device.device_id, outcome)
+                       for (device, _, _), outcome in zip(todo, outcomes))
+        return results
+
+    def _request_device_infos(self, device_ids):
+        """Request device/info for many devices concurrently.
+        Returns a dict mapping device id to response (or None)."""
+        if not device_ids:
+            return {}
+        return dict(zip(device_ids,
+                        self.executor.map(self._request_device,
+                                          device_ids)))
+
     def update(self):
         """Updates all devices and sensors from server."""
-        with self._lock:
-            def collect(devices, is_sensor=False):
-                """Update local state.
-                N.B. We prefix sensors with '_',
-                since apparently sensors and devices
-                do not share name space and there can
-                be collissions.
-                FIXME: Remove this hack."""
-                self._state.update({'_' * is_sensor + str(device['id']): device
-                                    for device in devices or {}
-                                    if device['name'] and
-                                    not (is_sensor and
-                                   'data' not in device)})
-
-            devices = self._request_devices()
-            for i, d in enumerate(devices):
-                if d.get('id') in list(self.device_ids):
-                    _LOGGER.debug("already known device")
-                    req_dev = self.device(d.get('id'))
-                    d.update({'parameters': req_dev.parameters})
-                    d.update({'protocol': req_dev.protocol})
-                    d.update({'model': req_dev.model})
-                    d.update({'client_id': req_dev.client_id})
-                    devices[i].update(d)
-                else:
-                    _LOGGER.debug("Getting protocol and parameters",
-                                  "for new device")
-                    req_dev = self._request_device(d.get('id'))
-                    d.update({'parameters': req_dev.get('parameter')})
-                    d.update({'protocol': req_dev.get('protocol')})
-                    d.update({'model': req_dev.get('model')})
-                    d.update({'client_id': req_dev.get('client')})
-                    devices[i].update(d)
-            collect(devices)
-
-            sensors = self._request_sensors()
-            collect(sensors, True)
-
-            return (devices is not None and
-                    sensors is not None)
+        with self._metrics.timed('update'):
+            return self._update()
+
+    def _update(self):
+        """Updates all devices and sensors from server."""
+        pending_sensors = self.executor.submit(self._request_sensors)
+        devices = self._request_devices()
+        infos = self._request_device_infos(self._new_device_ids(devices))
+        return self._updated(devices, infos, pending_sensors.result())
+
+    def _updated(self, devices, infos, sensors):
+        """Merge responses of an update.
+        Returns true if both lists and all device infos were received."""
+        self._merge_device_infos(devices, infos)
+        self._collect(devices)
+        self._collect_changed(sensors)
+
+        if self._state_file and (devices or sensors):
+            self.save_state(self._state_file)
+
+        return (devices is not None and
+                sensors is not None and
+                self._infos_received(infos))
+
+    def poll(self):
+        """Incrementally update sensors from server.
+        Returns set of ids of changed sensors, None if request failed."""
+        sensors = self._request_sensors()
+        return None if sensors is None else self._collect_changed(sensors)
+
+    def _update_devices(self):
+        """Update devices, but not sensors, from server."""
+        devices = self._request_devices()
+        infos = self._request_device_infos(self._new_device_ids(devices))
+        self._merge_device_infos(devices, infos)
+        self._collect(devices)
+        return devices is not None and self._infos_received(infos)
+
+
+def _interleave(groups):
+    """(key, item) pairs of dict of iterables, one of each in turn."""
+    return (pair
+            for pairs in zip_longest(*(zip(repeat(key), items)
+                                       for key, items in groups.items()))
+            for pair in pairs
+            if pair is not None)
+
+
+class _Poller:
+    """Background thread calling a step, which returns the number of
+    seconds to wait before calling it again."""
+
+    def __init__(self, name):
+        self._name = name
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self, step, delay, retry):
+        """Call step after delay seconds, and then after the delay it
+        returns, or retry seconds if it raised."""
+        self.stop()
+        self._stopped.clear()
+        self._thread = Thread(target=self._run,
+                              args=(step, delay, retry),
+                              name=self._name,
+                              daemon=True)
+        self._thread.start()
+
+    def _run(self, step, delay, retry):
+        while not self._stopped.wait(delay):
+            try:
+                delay = step()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Failed to poll')
+                delay = retry
+
+    def stop(self):
+        """Stop polling."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+def _periodic(update, poll, interval, update_interval):
+    """Step for _Poller calling poll every interval, and update instead
+    every update_interval."""
+    interval = interval.total_seconds()
+    update_interval = update_interval.total_seconds()
+    next_update = monotonic() + update_interval
+
+    def step():
+        nonlocal next_update
+        if monotonic() >= next_update:
+            next_update = monotonic() + update_interval
+            update()
+        else:
+            poll()
+        return interval
+
+    return step
 
-    def device(self, device_id):
-        """Return a device object."""
-        return Device(self, device_id)
+
+class SessionManager:
+    """Many hubs and accounts behind a single API.
+
+    Each hub is a Session, holding its own shard of state and lock.
+    All hubs share one thread pool for requests and one polling
+    thread, and devices of all hubs are found through one index."""
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='tellduslive')
+        self._lock = Lock()
+        self._hubs = {}
+        self._index = {}  # device id -> names of hubs
+        self._poller = _Poller('tellduslive-manager')
+
+    def add(self, name, **config):
+        """Add hub with Session configuration, returns its session."""
+        if name in self._hubs:
+            raise ValueError('Hub {} already added'.format(name))
+        session = Session(executor=self._executor, **config)
+        with self._lock:
+            added = name not in self._hubs
+            if added:
+                self._hubs = dict(self._hubs, **{name: session})
+        if not added:  # added concurrently
+            session.close()
+            raise ValueError('Hub {} already added'.format(name))
+        self._reindex()
+        return session
+
+    def remove(self, name):
+        """Remove and close hub."""
+        with self._lock:
+            hubs = dict(self._hubs)
+            session = hubs.pop(name)
+            self._hubs = hubs
+        session.close()
+        self._reindex()
 
     @property
-    def sensors(self):
-        """Return only sensors.
-        FIXME: terminology device vs device."""
-        return (device
-                for device in self.devices
-                if device.is_sensor)
+    def hubs(self):
+        """Sessions by name of hub."""
+        return dict(self._hubs)
+
+    def session(self, name):
+        """Return session of hub."""
+        return self._hubs[name]
+
+    def _reindex(self):
+        """Rebuild the global device index."""
+        index = {}
+        for name, session in self._hubs.items():
+            for device_id in session.device_ids:
+                index.setdefault(device_id, []).append(name)
+        self._index = {device_id: tuple(names)
+                       for device_id, names in index.items()}
+
+    def hub_of(self, device_id):
+        """Names of hubs knowing a device id."""
+        return self._index.get(device_id, ())
+
+    def device(self, device_id, hub=None):
+        """Return a device object from any hub.
+        Give hub if the id is known by more than one."""
+        if hub is None:
+            hubs = self.hub_of(device_id)
+            if len(hubs) > 1:
+                raise ValueError('Device {} is known by hubs {}'.format(
+                    device_id, ', '.join(hubs)))
+            hub = hubs[0] if hubs else None
+        if hub is None:
+            raise KeyError(device_id)
+        return self._hubs[hub].device(device_id)
 
     @property
     def devices(self):
-        """Request representations of all devices."""
-        return (self.device(device_id) for device_id in self.device_ids)
+        """Devices of all hubs."""
+        return chain.from_iterable(session.devices
+                                   for session in self._hubs.values())
 
     @property
-    def device_ids(self):
-        """List of known device ids."""
+    def sensors(self):
+        """Sensors of all hubs."""
+        return chain.from_iterable(session.sensors
+                                   for session in self._hubs.values())
+
+    def update(self):
+        """Update all hubs, sending their requests on the shared pool.
+        Returns dict of hub name to result of update."""
+        # pylint: disable=protected-access
+        hubs = self._hubs
+        submit = self._executor.submit
+        lists = {name: (submit(session._request_devices),
+                        submit(session._request_sensors))
+                 for name, session in hubs.items()}
+        devices = {name: pending[0].result()
+                   for name, pending in lists.items()}
+        # take turns between hubs, not to flood one hub at a time
+        infos = {name: {} for name in hubs}
+        for name, device_id in _interleave({
+                name: session._new_device_ids(devices[name])
+                for name, session in hubs.items()}):
+            infos[name][device_id] = submit(hubs[name]._request_device,
+                                            device_id)
+        results = {
+            name: session._updated(
+                devices[name],
+                {device_id: pending.result()
+                 for device_id, pending in infos[name].items()},
+                lists[name][1].result())
+            for name, session in hubs.items()}
+        self._reindex()
+        return results
+
+    def poll(self):
+        """Incrementally update sensors of all hubs.
+        Returns dict of hub name to set of ids of changed sensors,
+        or None if the request failed."""
+        # pylint: disable=protected-access
+        hubs = self._hubs
+        pending = {name: self._executor.submit(session._request_sensors)
+                   for name, session in hubs.items()}
+        results = {}
+        for name, session in hubs.items():
+            sensors = pending[name].result()
+            results[name] = (None if sensors is None else
+                             session._collect_changed(sensors))
+        self._reindex()
+        return results
+
+    def start(self, interval=POLL_INTERVAL, update_interval=UPDATE_INTERVAL):
+        """Poll sensors of all hubs every interval, and update
+        everything every update_interval, in a background thread."""
+        self._poller.start(_periodic(self.update, self.poll,
+                                     interval, update_interval),
+                           interval.total_seconds(),
+                           interval.total_seconds())
+
+    def stop(self):
+        """Stop background polling."""
+        self._poller.stop()
+
+    def close(self):
+        """Stop polling, close all hubs and release the thread pool."""
+        self.stop()
+        for session in self._hubs.values():
+            session.close()
+        self._executor.shutdown(wait=False)
+
+
+def _websocket_frame(payload, opcode=0x1):
+    """Encode an unmasked, final WebSocket frame (RFC 6455)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, 'big')
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+    return header + payload
+
+
+def _websocket_accept(key):
+    """Sec-WebSocket-Accept for a Sec-WebSocket-Key."""
+    # pylint: disable=import-outside-toplevel
+    from base64 import b64encode
+    from hashlib import sha1
+    return b64encode(sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+class Daemon:
+    """Serve the state of one Session to local clients.
+
+    Answers devices/list, sensors/list, device/info and sensor/info
+    from memory, and forwards device commands, in the format of the
+    local API, so that clients can use Session(host=<address>,
+    token=<anything>). Change events are pushed as JSON over a
+    WebSocket at /events. The session keeps its state current by
+    polling, and by listening for UDP packets if configured to."""
+
+    def __init__(self, config, address=('127.0.0.1', DAEMON_PORT)):
+        self._address = address
+        self._clients = set()
+        self._clients_lock = Lock()
+        self._bodies = {}  # endpoint -> (state version, response body)
+        self.session = Session(on_change=self._broadcast, **config)
+        self._poller = _Poller('tellduslive-daemon')
+        self._server = None
+
+    @property
+    def address(self):
+        """Address served on."""
+        return self._server.server_address if self._server else None
+
+    def start(self, interval=POLL_INTERVAL, update_interval=UPDATE_INTERVAL):
+        """Update state, then serve and poll in background threads."""
+        # pylint: disable=import-outside-toplevel
+        from http.server import ThreadingHTTPServer
+        if not self.session.update():
+            _LOGGER.warning('Could not update status from server')
+        self._server = ThreadingHTTPServer(self._address, self._handler())
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever,
+               name='tellduslive-server', daemon=True).start()
+        self._poller.start(_periodic(self.session.update, self.session.poll,
+                                     interval, update_interval),
+                           interval.total_seconds(),
+                           interval.total_seconds())
+        _LOGGER.info('Serving on %s:%s', *self.address)
+
+    def close(self):
+        """Stop serving and polling, and close the session."""
+        self._poller.stop()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._clients_lock:
+            for client in self._clients:
+                self._disconnect(client)
+            self._clients.clear()
+        self.session.close()
+
+    @staticmethod
+    def _disconnect(client):
+        """Make WebSocket client close, dropping queued events."""
+        with client.mutex:
+            client.queue.clear()
+            client.queue.append(None)
+            client.not_empty.notify()
+
+    def _broadcast(self, event):
+        """Queue change event for all WebSocket clients."""
+        message = json.dumps(event._asdict()).encode()
+        with self._clients_lock:
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(message)
+                except Full:
+                    _LOGGER.warning('Dropping slow WebSocket client')
+                    self._clients.discard(client)
+                    self._disconnect(client)
+
+    def _list(self, endpoint, key, sensors):
+        """Response body of a list endpoint, cached until the state
+        changes, also in place by commands and packets."""
+        # pylint: disable=protected-access
+        with self.session._lock:
+            version = self.session._version
+            state = self.session._state
+            cached = self._bodies.get(endpoint)
+            if cached and cached[0] == version:
+                return cached[1]
+            body = json.dumps({key: [
+                dict(device, id=device_id[1:]) if sensors else device
+                for device_id, device in state.items()
+                if device_id.startswith('_') == sensors]}).encode()
+        self._bodies[endpoint] = (version, body)
+        return body
+
+    def _command(self, name, params):
+        """Send command to device."""
+        command = next((command for command in COMMANDS
+                        if METHODS[command] == name), None)
+        device_id = params.get('id')
+        if command is None:
+            return {'error': 'Unsupported command {}'.format(name)}
+        if device_id not in self.session.device_ids:
+            return {'error': 'Device not found'}
+        if command == DIM:
+            try:
+                level = int(params.get('level', 255))
+            except (TypeError, ValueError):
+                level = None
+            if level is None or not 0 <= level <= 255:
+                return {'error': 'Invalid level'}
+        device = self.session.device(device_id)
+        result = (device.dim(level)
+                  if command == DIM else
+                  getattr(device, COMMANDS[command])())
+        return ({'status': 'success'} if result else
+                {'error': 'Command failed'})
+
+    def respond(self, endpoint, params):
+        """Return response body to a request for an endpoint."""
+        # pylint: disable=protected-access
+        if endpoint == 'devices/list':
+            return self._list(endpoint, 'device', False)
+        if endpoint == 'sensors/list':
+            return self._list(endpoint, 'sensor', True)
+        if endpoint in ('token', 'refreshToken'):
+            result = {'token': 'daemon',
+                      'expires': int(time() + DAEMON_TOKEN_LIFETIME)}
+        elif endpoint == 'device/info':
+            device = self.session._device(params.get('id'))
+            result = dict(device, parameter=device.get('parameters'),
+                          client=device.get('client_id')) if device else {
+                              'error': 'Device not found'}
+        elif endpoint == 'sensor/info':
+            sensor = self.session._device('_{}'.format(params.get('id')))
+            result = dict(sensor, id=params.get('id')) if sensor else {
+                'error': 'Sensor not found'}
+        elif endpoint.startswith('device/'):
+            result = self._command(endpoint[len('device/'):], params)
+        else:
+            result = {'error': 'Unknown endpoint {}'.format(endpoint)}
+        return json.dumps(result).encode()
+
+    def _events(self, handler):
+        """Push change events over WebSocket until the client is gone."""
+        key = handler.headers.get('Sec-WebSocket-Key')
+        if not key:
+            handler.send_error(400, 'Expected WebSocket upgrade')
+            return
+        handler.send_response(101)
+        handler.send_header('Upgrade', 'websocket')
+        handler.send_header('Connection', 'Upgrade')
+        handler.send_header('Sec-WebSocket-Accept', _websocket_accept(key))
+        handler.end_headers()
+        handler.close_connection = True
+        client = Queue(maxsize=WEBSOCKET_QUEUE)
+        with self._clients_lock:
+            self._clients.add(client)
+        try:
+            while True:
+                try:
+                    message = client.get(timeout=WEBSOCKET_PING)
+                except Empty:
+                    handler.wfile.write(_websocket_frame(b'', opcode=0x9))
+                    continue
+                if message is None:
+                    handler.wfile.write(_websocket_frame(b'', opcode=0x8))
+                    break
+                handler.wfile.write(_websocket_frame(message))
+        except OSError as e:
+            _LOGGER.debug('WebSocket client gone: %s', e)
+        finally:
+            with self._clients_lock:
+                self._clients.discard(client)
+
+    def _handler(self):
+        # pylint: disable=import-outside-toplevel
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qsl, urlsplit
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler."""
+
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                _LOGGER.debug(*args)
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Answer /api/<endpoint>, /json/<endpoint> and /events."""
+                url = urlsplit(self.path)
+                if url.path == '/events':
+                    daemon._events(self)  # pylint: disable=protected-access
+                    return
+                _, _, endpoint = url.path.lstrip('/').partition('/')
+                body = daemon.respond(endpoint, dict(parse_qsl(url.query)))
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_PUT = do_GET
+
+        return Handler
+
+
+class _Cadence:
+    """Learned reporting interval of a device."""
+
+    __slots__ = ('last', 'interval', 'checked', 'misses')
+
+    def __init__(self, last, interval, now):
+        self.last = last  # lastUpdated, as reported
+        self.interval = interval
+        self.checked = now
+        self.misses = 0
+
+
+class PollingScheduler:
+    """Poll a Session adaptively, refreshing only what is probably stale.
+
+    The reporting interval of each sensor is learned from lastUpdated,
+    and a sensor is refreshed once it is overdue. A few stale sensors
+    or switches are refreshed by sensor/info or device/info, more by a
+    single list request. A sensor that does not report when expected
+    is checked again with exponential backoff. Devices heard by the UDP
+    listener are left to it: sensors as long as they keep reporting,
+    switches once seen at all. Other switches, which only change when
+    commanded, are refreshed every update_interval."""
+
+    ALPHA = 0.3  # weight of the latest interval in the learned cadence
+
+    def __init__(self, session,
+                 min_interval=SCHEDULER_MIN_INTERVAL,
+                 max_interval=SCHEDULER_MAX_INTERVAL,
+                 update_interval=UPDATE_INTERVAL,
+                 list_threshold=LIST_THRESHOLD):
+        self._session = session
+        self._min = min_interval.total_seconds()
+        self._max = max_interval.total_seconds()
+        self._update_interval = update_interval.total_seconds()
+        self._list_threshold = list_threshold
+        self._cadences = {}  # device id -> _Cadence
+        self._poller = _Poller('tellduslive-scheduler')
+        self.requests = 0  # sent by the scheduler
+
+    def cadence(self, device_id):
+        """Learned reporting interval of sensor in seconds, if known."""
+        cadence = self._cadences.get(device_id)
+        return cadence.interval if cadence else None
+
+    def _heard(self, device):
+        """Time a UDP packet was last received from device, if any."""
+        # pylint: disable=protected-access
+        packets = getattr(self._session, '_last_packets', {})
+        key = (self._session._sensor_key(device) if 'sensorId' in device
+               else self._session._switch_key(device))
+        packet = packets.get(key)
+        return packet[1] if packet else None
+
+    def _observe(self, now):
+        """Learn from lastUpdated of sensors in state."""
+        state = self._session._state  # pylint: disable=protected-access
+        for device_id, device in state.items():
+            last = device.get('lastUpdated')
+            cadence = self._cadences.get(device_id)
+            if cadence is None:
+                # learn from below: reports are only seen one by one
+                # when checking more often than they arrive
+                self._cadences[device_id] = _Cadence(last, self._min, now)
+            elif last != cadence.last:
+                if last and cadence.last and last > cadence.last:
+                    cadence.interval += self.ALPHA * (
+                        min(last - cadence.last, self._max) -
+                        cadence.interval)
+                cadence.last = last
+                cadence.misses = 0
+
+    def _due(self, device_id, device, cadence):
+        """Time at which device should be refreshed, None for never."""
+        heard = self._heard(device)
+        if not device_id.startswith('_'):
+            return (None if heard else
+                    cadence.checked + self._update_interval)
+        seen = max(cadence.last or 0, heard or 0)
+        due = seen + cadence.interval + self._min
+        if cadence.misses:
+            due = max(due, cadence.checked + min(
+                self._max,
+                max(self._min, cadence.interval / 2) *
+                2 ** (cadence.misses - 1)))
+        return min(due, cadence.checked + self._max)
+
+    def stale(self, now=None):
+        """Ids of devices due for a refresh, and time of the next one."""
+        now = now or time()
+        self._observe(now)
+        state = self._session._state  # pylint: disable=protected-access
+        stale = []
+        upcoming = now + self._max
+        for device_id, device in state.items():
+            due = self._due(device_id, device, self._cadences[device_id])
+            if due is None:
+                continue
+            if due <= now:
+                stale.append(device_id)
+            else:
+                upcoming = min(upcoming, due)
+        return stale, upcoming
+
+    def _refresh_sensors(self, sensor_ids):
+        # pylint: disable=protected-access
+        session = self._session
+        if len(sensor_ids) >= self._list_threshold:
+            self.requests += 1
+            session.poll()
+        else:
+            self.requests += len(sensor_ids)
+            session._collect_changed(
+                [sensor for sensor in session.executor.map(
+                    session._request_sensor,
+                    [sensor_id[1:] for sensor_id in sensor_ids])
+                 if sensor])
+
+    def _refresh_switches(self, device_ids):
+        # pylint: disable=protected-access
+        session = self._session
+        if len(device_ids) >= self._list_threshold:
+            self.requests += 1
+            session._update_devices()
+        else:
+            self.requests += len(device_ids)
+            for device_id, info in zip(device_ids, session.executor.map(
+                    session._request_device, device_ids)):
+                if info:
+                    session._update_device(
+                        device_id, **{field: info[field]
+                                      for field in ('name', 'state',
+                                                    'statevalue')
+                                      if field in info})
+
+    def run_once(self, now=None):
+        """Refresh stale devices.
+        Returns seconds until the next device is due."""
+        now = now or time()
+        stale, _ = self.stale(now)
+        sensors = [device_id for device_id in stale
+                   if device_id.startswith('_')]
+        switches = [device_id for device_id in stale
+                    if not device_id.startswith('_')]
+        before = {device_id: self._cadences[device_id].last
+                  for device_id in sensors}
+        if sensors:
+            self._refresh_sensors(sensors)
+        if switches:
+            self._refresh_switches(switches)
+        now = time()
+        self._observe(now)
+        for device_id in stale:
+            cadence = self._cadences[device_id]
+            if device_id in before and cadence.last == before[device_id]:
+                # not reported yet, check again later
+                cadence.misses += 1
+            cadence.checked = now
+        _, upcoming = self.stale(now)
+        return max(1, upcoming - now)
+
+    def start(self):
+        """Poll in a background thread."""
+        self._poller.start(self.run_once, 0, self._min)
+
+    def stop(self):
+        """Stop polling."""
+        self._poller.stop()
+
+
+def _number(value):
+    """Parse value of sensor item."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+
+
+def _scale(scale):
+    """Parse scale of sensor item."""
+    try:
+        return int(scale)
+    except (TypeError, ValueError):
+        return scale
+
+
+def _timestamp(value):
+    """Unix timestamp of datetime or number."""
+    return int(value.timestamp() if isinstance(value, datetime) else value)
+
+
+def _chunks(start, end, chunk):
+    """Split time range into (from, to) timestamps of chunk length."""
+    start = _timestamp(start)
+    end = _timestamp(end or time())
+    step = int(chunk.total_seconds())
+    for chunk_start in range(start, end, step):
+        yield chunk_start, min(chunk_start + step, end)
+
+
+def _readings(device_id, history):
+    """Readings in a sensor/history response."""
+    return [Reading(device_id, entry.get('ts'), item.get('name'),
+                    _scale(item.get('scale')), _number(item.get('value')))
+            for entry in history or ()
+            for item in entry.get('data') or ()]
+
+
+def write_history(readings, path, batch_size=10000):
+    """Write Readings to a Parquet file (requires pyarrow),
+    batch by batch so memory use stays flat.
+    Returns number of readings written."""
+    # pylint: disable=import-outside-toplevel
+    import pyarrow
+    import pyarrow.parquet
+    schema = pyarrow.schema([('device_id', pyarrow.string()),
+                             ('timestamp', pyarrow.int64()),
+                             ('name', pyarrow.string()),
+                             ('scale', pyarrow.int32()),
+                             ('value', pyarrow.float64())])
+    written = 0
+    readings = iter(readings)
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(readings, batch_size))
+            if not batch:
+                return written
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type)
+                 for column, field in zip(zip(*batch), schema)],
+                schema=schema))
+            written += len(batch)
+
+
+def _field(name):
+    """Property reading a field of the raw representation of a device."""
+    def getter(self):
+        # pylint: disable=protected-access
+        device = self._session._state.get(self._device_id)
+        return device.get(name) if device else None
+    return property(getter, doc='Value of {} of device.'.format(name))
+
+
+class _Coalescer:
+    """Send only the latest of the commands to a device given within
+    a window, updating the local state at once."""
+
+    def __init__(self, device, window):
+        self._device = device
+        self._window = window.total_seconds()
+        self._lock = Lock()
+        self._send_lock = Lock()
+        self._pending = None  # (command, params) to send
+        self._previous = None  # fields before first pending command
+        self._future = None  # result of next send
+
+    def submit(self, command, params):
+        """Queue command, replacing any pending one."""
+        device = self._device
+        with self._lock:
+            if self._pending is None:
+                self._previous = dict(
+                    state=device.state,
+                    statevalue=(device.device or {}).get('statevalue'))
+                self._future = self._schedule()
+            self._pending = (command, params)
+        fields = dict(state=command)
+        if 'level' in params:
+            fields.update(statevalue=params['level'])
+        # pylint: disable=protected-access
+        device._session._update_device(device.device_id, **fields)
+        return True
+
+    def _schedule(self):
+        """Send pending command after window, return future of result."""
+        future = Future()
+        timer = Timer(self._window, self._flush, (future,))
+        timer.daemon = True
+        timer.start()
+        return future
+
+    def _take(self):
+        """Take pending command."""
         with self._lock:
-            return self._state.keys()
+            pending, self._pending = self._pending, None
+            return pending, self._previous
+
+    def _done(self, result, previous):
+        """Restore state if sending failed, unless superseded."""
+        if not result:
+            with self._lock:
+                superseded = self._pending is not None
+            if not superseded:
+                # pylint: disable=protected-access
+                self._device._session._update_device(
+                    self._device.device_id, **previous)
+        return bool(result)
+
+    def _flush(self, future):
+        (command, params), previous = self._take()
+        with self._send_lock:
+            # pylint: disable=protected-access
+            result = self._device._send(command, **params)
+        future.set_result(self._done(result, previous))
+
+    def wait(self, timeout=None):
+        """Wait for the latest command to be sent, return result."""
+        with self._lock:
+            future = self._future
+        return future.result(timeout) if future else True
+
+
+class _AsyncCoalescer(_Coalescer):
+    """Coalescer running on the event loop."""
+
+    def __init__(self, device, window):
+        super().__init__(device, window)
+        self._send_lock = asyncio.Lock()
+        # running flushes, referenced so they are not garbage collected
+        self._tasks = set()
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.call_later(self._window, self._start_flush, future)
+        return future
+
+    def _start_flush(self, future):
+        """Run a flush as a task, kept until done."""
+        task = asyncio.ensure_future(self._flush(future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, future):
+        (command, params), previous = self._take()
+        async with self._send_lock:
+            # pylint: disable=protected-access
+            result = await self._device._send(command, **params)
+        future.set_result(self._done(result, previous))
+
+    async def wait(self, timeout=None):
+        with self._lock:
+            future = self._future
+        return (await asyncio.wait_for(asyncio.shield(future), timeout)
+                if future else True)
 
 
 class Device:
-    """Tellduslive device."""
+    """Tellduslive device.
+    Wrappers are reused by the session, so sensor items are only
+    rebuilt when the data of the sensor changes."""
+
+    __slots__ = ('_session', '_device_id', '_data', '_items')
+
+    _coalescer = _Coalescer
 
     def __init__(self, session, device_id):
         self._session = session
         self._device_id = device_id
+        self._data = None
+        self._items = ()
 
     def __str__(self):
         if self.is_sensor:
@@ -693,12 +3198,19 @@ class Device:
                         value=self.statevalue,
                         methods=self._str_methods(self.methods))
 
-    def __getattr__(self, name):
-        if (self.device and
-            name in ['name', 'state', 'battery', 'unit', 'house',
-                     'model', 'protocol', 'parameters', 'client_id',
-                     'lastUpdated', 'methods', 'data', 'sensorId']):
-            return self.device.get(name)
+    name = _field('name')
+    state = _field('state')
+    battery = _field('battery')
+    unit = _field('unit')
+    house = _field('house')
+    model = _field('model')
+    protocol = _field('protocol')
+    parameters = _field('parameters')
+    client_id = _field('client_id')
+    lastUpdated = _field('lastUpdated')
+    methods = _field('methods')
+    data = _field('data')
+    sensorId = _field('sensorId')
 
     @property
     def device(self):
@@ -721,14 +3233,48 @@ class Device:
         return "|".join(res)
 
     def _execute(self, command, **params):
+        """Send (or queue, if coalescing) command and update local state."""
+        # pylint: disable=protected-access
+        coalescer = self._session._coalescers.get(self.device_id)
+        if coalescer:
+            return coalescer.submit(command, params)
+        return self._send(command, **params)
+
+    def _send(self, command, **params):
         """Send command to server and update local state."""
         params.update(id=self.device_id)
         # Corresponding API methods
         method = 'device/{}'.format(METHODS[command])
         if self._session.execute(method, **params):
-            self.device['state'] = command
+            # pylint: disable=protected-access
+            self._session._update_device(self.device_id, state=command)
             return True
 
+    def coalesce(self, window=COALESCE_WINDOW):
+        """Coalesce commands given within window (a timedelta), sending
+        only the latest. Commands then update the local state and return
+        at once, wait() gives the result of the latest command.
+        A window of None turns coalescing off."""
+        # pylint: disable=protected-access
+        if window:
+            self._session._coalescers[self.device_id] = self._coalescer(
+                self, window)
+        else:
+            self._session._coalescers.pop(self.device_id, None)
+
+    def wait(self, timeout=None):
+        """Wait for the latest coalesced command to be sent.
+        Returns true if successful."""
+        # pylint: disable=protected-access
+        coalescer = self._session._coalescers.get(self.device_id)
+        return coalescer.wait(timeout) if coalescer else True
+
+    def is_noop(self, command, level=None):
+        """Return true if command would not change the known state."""
+        if self.state != command:
+            return False
+        return command != DIM or self.dim_level == int(level)
+
     @property
     def is_sensor(self):
         """Return true if this is a sensor."""
@@ -770,7 +3316,8 @@ class Device:
     def dim(self, level):
         """Dim device."""
         if self._execute(DIM, level=level):
-            self.device['statevalue'] = level
+            # pylint: disable=protected-access
+            self._session._update_device(self.device_id, statevalue=level)
             return True
 
     def up(self):
@@ -785,33 +3332,513 @@ class Device:
         """Stop device."""
         return self._execute(STOP)
 
+    def sensor_history(self, start, end=None, **kwargs):
+        """Generate Readings of sensor in a time range, oldest first.
+        See Session.sensor_history."""
+        return self._session.sensor_history(self.device_id, start, end,
+                                            **kwargs)
+
     @property
     def items(self):
         """Return sensor items for sensor."""
-        return (SensorItem(item) for item in self.data) if self.data else []
+        data = self.data
+        if data is not self._data:
+            self._items = tuple(SensorItem(item)
+                                for item in data) if data else ()
+            self._data = data
+        return self._items
 
     def item(self, name, scale):
         """Return sensor item."""
+        key = (name, _scale(scale))
         return next((item for item in self.items
-                     if (item.name == name and
-                         int(item.scale) == int(scale))), None)
+                     if (item.name, _scale(item.scale)) == key), None)
 
     def value(self, name, scale):
-        """Return value of sensor item."""
-        return self.item(name, scale).value
+        """Return value of sensor item, parsed as a number."""
+        # pylint: disable=protected-access
+        values = self._session._values.get(self.device_id)
+        return values.get((name, _scale(scale))) if values else None
+
+    @property
+    def values(self):
+        """Return parsed values of sensor, by (name, scale)."""
+        # pylint: disable=protected-access
+        return self._session._values.get(self.device_id) or {}
 
 
 class SensorItem:
-    # pylint: disable=too-few-public-methods, no-member
+    # pylint: disable=too-few-public-methods
     """Reference to a sensor data item."""
+
+    __slots__ = ('name', 'value', 'scale', 'lastUpdated')
+
     def __init__(self, data):
-        vars(self).update(data)
+        self.name = data.get('name')
+        self.value = data.get('value')
+        self.scale = data.get('scale')
+        self.lastUpdated = data.get('lastUpdated')
 
     def __str__(self):
         return '{name}={value}'.format(
             name=self.name, value=self.value)
 
 
+class AsyncAPISession:
+    """Base for the asyncio connections, using aiohttp."""
+
+    def __init__(self, url, websession=None):
+        self.url = url
+        self.access_token = None
+        self.access_token_secret = None
+        self._websession = websession
+        self._owns_websession = websession is None
+
+    @property
+    def authorized(self):
+        """Return true if successfully authorized."""
+        return bool(self.access_token)
+
+    def _sign(self, url):
+        """Return url and headers to use for request."""
+        raise NotImplementedError
+
+    async def get(self, url, params=None, timeout=None):
+        """Perform request, return body of response."""
+        return await self._fetch(url, params, timeout,
+                                 lambda response: response.read())
+
+    async def get_list(self, url, key, params=None, timeout=None):
+        """Perform request to a list endpoint, decoding the response
+        while it is read, as by _ListDecoder.
+        Returns number of bytes read and result."""
+        async def read(response):
+            decoder = _ListDecoder(key)
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK):
+                decoder.feed(chunk)
+            return decoder.nbytes, decoder.result()
+
+        return await self._fetch(url, params, timeout, read)
+
+    async def _fetch(self, url, params, timeout, read):
+        """Perform request, return result of coroutine function read
+        of the response."""
+        # pylint: disable=import-outside-toplevel
+        import aiohttp
+        from yarl import URL
+        if params:
+            url = '{}?{}'.format(url, urlencode(params))
+        url, headers = self._sign(url)
+        if not self._websession:
+            self._websession = aiohttp.ClientSession()
+        try:
+            async with self._websession.get(
+                    URL(url, encoded=True),
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                response.raise_for_status()
+                return await read(response)
+        except asyncio.TimeoutError as e:
+            raise TimeoutError('Request timed out') from e
+        except aiohttp.ClientError as e:
+            raise OSError(str(e) or type(e).__name__) from e
+
+    async def maybe_refresh_token(self):
+        """Refresh access_token if expired."""
+        pass
+
+    async def close(self):
+        """Close the underlying connection pool, if owned by us."""
+        if self._websession and self._owns_websession:
+            await self._websession.close()
+            self._websession = None
+
+
+class AsyncLocalAPISession(AsyncAPISession):
+    """Connect directly to the device, using asyncio."""
+
+    def __init__(self, host, application, access_token, websession=None):
+        super().__init__(TELLDUS_LOCAL_API_URL.format(host=host), websession)
+        self._host = host
+        self._application = application
+        self.access_token = access_token
+        self.token_timestamp = None
+        self.token_expires = None
+        self._refresh_lock = None
+        self._refresher = None
+
+    def _sign(self, url):
+        return url, {'Authorization': 'Bearer {}'.format(self.access_token)}
+
+    async def refresh_access_token(self):
+        """Refresh api token"""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            try:
+                result = json.loads(await self.get(
+                    TELLDUS_LOCAL_REFRESH_TOKEN_URL.format(host=self._host),
+                    timeout=TIMEOUT.seconds))
+                if 'token' not in result:
+                    raise ValueError(result.get('error', 'No token'))
+                self.access_token = result['token']
+                self.token_timestamp = datetime.now()
+                self.token_expires = _token_expiry(result)
+                _LOGGER.debug('Token expires %s', self.token_expires)
+                return True
+            except (OSError, ValueError) as e:
+                _LOGGER.error('Failed to refresh access token: %s', e)
+
+    async def _refresh(self):
+        """Refresh token ahead of expiry, retrying with backoff."""
+        retry = 0
+        while True:
+            if await self.refresh_access_token():
+                retry = 0
+                await asyncio.sleep(_refresh_delay(self.token_expires))
+            else:
+                await asyncio.sleep(_retry_delay(retry))
+                retry += 1
+
+    async def maybe_refresh_token(self):
+        """Make sure the token is refreshed in the background.
+        Never waits for a refresh."""
+        if self._refresher is None:
+            self._refresher = asyncio.ensure_future(self._refresh())
+
+    async def close(self):
+        """Stop refreshing the token and close the connection pool."""
+        if self._refresher:
+            self._refresher.cancel()
+            self._refresher = None
+        await super().close()
+
+
+class AsyncLiveAPISession(AsyncAPISession):
+    """Connection to the cloud service, using asyncio."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 public_key,
+                 private_key,
+                 token,
+                 token_secret,
+                 application=None,
+                 websession=None):
+        super().__init__(TELLDUS_LIVE_API_URL, websession)
+        # pylint: disable=import-outside-toplevel
+        from oauthlib.oauth1 import Client
+        self._client = Client(public_key,
+                              client_secret=private_key,
+                              resource_owner_key=token,
+                              resource_owner_secret=token_secret)
+        self._application = application
+        self.access_token = token
+        self.access_token_secret = token_secret
+
+    def _sign(self, url):
+        url, headers, _ = self._client.sign(url)
+        if self._application:
+            headers['X-Application'] = self._application
+        return url, headers
+
+
+class AsyncSession(BaseSession):
+    """Tellduslive session for use with asyncio.
+
+    Mirrors Session, but requests, update and device commands
+    are coroutines."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 public_key=None,
+                 private_key=None,
+                 token=None,
+                 token_secret=None,
+                 host=None,
+                 application=None,
+                 websession=None,  # aiohttp.ClientSession to use
+                 workers=DEFAULT_WORKERS,  # max concurrent info requests
+                 on_change=None,  # callback for ChangeEvents
+                 metrics=None,  # Instrumentation, e.g. Metrics()
+                 history=None,  # SensorHistory to record readings in
+                 rate_limiter=None,  # RateLimiter for requests
+                 decoder=None):  # JSON loads, e.g. fast_decoder()
+        super().__init__(on_change, metrics=metrics, history=history)
+        self._rate_limiter = rate_limiter
+        self._loads = decoder
+        _LOGGER.info('%s version %s', __name__, __version__)
+        if not (all([public_key,
+                     private_key,
+                     token,
+                     token_secret]) or
+                all([host, token])):
+            raise ValueError('Missing configuration')
+
+        self._workers = workers
+        self._session = (
+            AsyncLocalAPISession(host,
+                                 application,
+                                 token,
+                                 websession) if host and not public_key else
+            AsyncLiveAPISession(public_key,
+                                private_key,
+                                token,
+                                token_secret,
+                                application,
+                                websession))
+
+    @property
+    def access_token(self):
+        """Return access token."""
+        return self._session.access_token
+
+    @property
+    def is_authorized(self):
+        """Return true if successfully authorized."""
+        return self._session.authorized
+
+    @property
+    def access_token_secret(self):
+        """Return the token secret."""
+        return self._session.access_token_secret
+
+    async def close(self):
+        """Close the connection."""
+        await self._session.close()
+
+    async def _request(self, path, **params):
+        """Send a request to the Tellstick Live API,
+        rate limited and retried if there is a rate limiter."""
+        limiter = self._rate_limiter
+        if not limiter:
+            return (await self._request_once(path, **params))[0]
+        for attempt in range(limiter.retries + 1):
+            await limiter.acquire_async(path)
+            result, error = await self._request_once(path, **params)
+            limiter.feedback(path, error)
+            if not error or not _retryable(error):
+                break
+            _LOGGER.debug('Retrying %s, attempt %d', path, attempt + 1)
+        return result
+
+    async def _request_once(self, path, **params):
+        """Send a request to the Tellstick Live API.
+        Returns result and error."""
+        start = monotonic()
+        nbytes = 0
+        try:
+            await self._session.maybe_refresh_token()
+            url = urljoin(self._session.url, path)
+            _LOGGER.debug('Request %s %s', url, params)
+            # stream list endpoints, unless decoding with another library
+            key = None if self._loads else LIST_KEYS.get(path)
+            if key:
+                nbytes, response = await self._session.get_list(
+                    url, key, params=params, timeout=TIMEOUT.seconds)
+            else:
+                body = await self._session.get(url,
+                                               params=params,
+                                               timeout=TIMEOUT.seconds)
+                nbytes = len(body)
+                response = _decode(body, path, self._loads)
+            _LOGGER.debug('Response %s', response)
+            if 'error' in response:
+                raise _APIError(response['error'])
+            self._metrics.request(path, monotonic() - start,
+                                  nbytes, _count_items(response))
+            return response, None
+        except (OSError, ValueError) as error:
+            _LOGGER.warning('Failed request: %s', error)
+            self._metrics.request(path, monotonic() - start,
+                                  nbytes, 0, _error_kind(error))
+            return None, error
+
+    async def execute(self, method, **params):
+        """Make request, check result if successful."""
+        with self._metrics.timed('execute'):
+            response = await self._request(method, **params)
+            return response and response.get('status') == 'success'
+
+    async def _request_devices(self):
+        """Request list of devices from server."""
+        res = await self._request('devices/list',
+                                  supportedMethods=SUPPORTED_METHODS,
+                                  includeIgnored=0)
+        return res.get('device') if res else None
+
+    async def _request_device(self, id):
+        """Request info of device from server."""
+        return await self._request('device/info',
+                                   id=id)
+
+    async def _request_sensor(self, id):
+        """Request info of sensor from server."""
+        return await self._request('sensor/info',
+                                   id=id)
+
+    async def _request_sensors(self):
+        """Request list of sensors from server."""
+        res = await self._request('sensors/list',
+                                  includeValues=1,
+                                  includeScale=1,
+                                  includeIgnored=0)
+        return res.get('sensor') if res else None
+
+    async def _request_sensor_history(self, id, start, end):
+        """Request readings of sensor in time range from server."""
+        res = await self._request('sensor/history',
+                                  id=id,
+                                  includeKey=0,
+                                  **{'from': start, 'to': end})
+        if res is None:
+            raise OSError('Failed to fetch history of sensor {} '
+                          'from {} to {}'.format(id, start, end))
+        return _readings('_' + str(id), res.get('history'))
+
+    async def sensor_history(self, device_id, start, end=None,
+                             chunk=HISTORY_CHUNK, workers=None):
+        """Generate Readings of a sensor in a time range, oldest first.
+        See Session.sensor_history."""
+        pending = deque()
+        ranges = _chunks(start, end, chunk)
+        workers = workers or self._workers
+        try:
+            while True:
+                while len(pending) < workers:
+                    chunk_range = next(ranges, None)
+                    if not chunk_range:
+                        break
+                    pending.append(asyncio.ensure_future(
+                        self._request_sensor_history(
+                            str(device_id).lstrip('_'), *chunk_range)))
+                if not pending:
+                    return
+                for reading in await pending.popleft():
+                    yield reading
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def execute_batch(self, commands, parallelism=None, force=False):
+        """Send commands to many devices concurrently.
+        See Session.execute_batch."""
+        results, todo = self._batch(commands, force)
+        semaphore = asyncio.Semaphore(parallelism or self._workers)
+
+        async def run(device, command, params):
+            async with semaphore:
+                return bool(await getattr(device, COMMANDS[command])(
+                    **params))
+
+        outcomes = await asyncio.gather(*(run(*entry) for entry in todo))
+        results.update((device.device_id, outcome)
+                       for (device, _, _), outcome in zip(todo, outcomes))
+        return results
+
+    async def _request_device_infos(self, device_ids):
+        """Request device/info for many devices concurrently.
+        Returns a dict mapping device id to response (or None)."""
+        semaphore = asyncio.Semaphore(self._workers)
+
+        async def request(device_id):
+            async with semaphore:
+                return await self._request_device(device_id)
+
+        return dict(zip(device_ids,
+                        await asyncio.gather(*(request(device_id)
+                                               for device_id in device_ids))))
+
+    async def update(self):
+        """Updates all devices and sensors from server."""
+        with self._metrics.timed('update'):
+            return await self._update()
+
+    async def _update(self):
+        """Updates all devices and sensors from server."""
+        devices, sensors = await asyncio.gather(self._request_devices(),
+                                                self._request_sensors())
+        infos = await self._request_device_infos(
+            self._new_device_ids(devices))
+        self._merge_device_infos(devices, infos)
+        self._collect(devices)
+        self._collect_changed(sensors)
+
+        return (devices is not None and
+                sensors is not None and
+                self._infos_received(infos))
+
+    async def poll(self):
+        """Incrementally update sensors from server.
+        Returns set of ids of changed sensors, None if request failed."""
+        sensors = await self._request_sensors()
+        return None if sensors is None else self._collect_changed(sensors)
+
+    def _new_device(self, device_id):
+        """Create wrapper for device."""
+        return AsyncDevice(self, device_id)
+
+
+class AsyncDevice(Device):
+    """Tellduslive device with awaitable commands."""
+
+    __slots__ = ()
+
+    _coalescer = _AsyncCoalescer
+
+    async def _execute(self, command, **params):
+        """Send (or queue, if coalescing) command and update local state."""
+        # pylint: disable=protected-access
+        coalescer = self._session._coalescers.get(self.device_id)
+        if coalescer:
+            return coalescer.submit(command, params)
+        return await self._send(command, **params)
+
+    async def _send(self, command, **params):
+        """Send command to server and update local state."""
+        params.update(id=self.device_id)
+        # Corresponding API methods
+        method = 'device/{}'.format(METHODS[command])
+        if await self._session.execute(method, **params):
+            # pylint: disable=protected-access
+            self._session._update_device(self.device_id, state=command)
+            return True
+
+    async def turn_on(self):
+        """Turn device on."""
+        return await self._execute(TURNON)
+
+    async def turn_off(self):
+        """Turn device off."""
+        return await self._execute(TURNOFF)
+
+    async def dim(self, level):
+        """Dim device."""
+        if await self._execute(DIM, level=level):
+            # pylint: disable=protected-access
+            self._session._update_device(self.device_id, statevalue=level)
+            return True
+
+    async def up(self):
+        """Pull device up."""
+        return await self._execute(UP)
+
+    async def wait(self, timeout=None):
+        """Wait for the latest coalesced command to be sent.
+        Returns true if successful."""
+        # pylint: disable=protected-access
+        coalescer = self._session._coalescers.get(self.device_id)
+        return await coalescer.wait(timeout) if coalescer else True
+
+    async def down(self):
+        """Pull device down."""
+        return await self._execute(DOWN)
+
+    async def stop(self):
+        """Stop device."""
+        return await self._execute(STOP)
+
+
 def read_credentials():
     from sys import argv
     from os.path import join, dirname, expanduser
@@ -0,0 +1,93 @@
+# -*- mode: python; coding: utf-8 -*-
+
+"""Tests of the asyncio client against the local fake Telldus server."""
+
+import asyncio
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import tellduslive  # noqa: E402
+from fake_server import FakeTelldusServer  # noqa: E402
+
+pytest.importorskip('aiohttp')
+
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture
+def server():
+    with FakeTelldusServer(devices=3, sensors=2) as server:
+        yield server
+
+
+def run(coroutine):
+    """Run coroutine on a new event loop."""
+    return asyncio.run(coroutine)
+
+
+def test_update_and_commands(server):
+    async def main():
+        session = tellduslive.AsyncSession(host=server.host, token='x')
+        try:
+            assert await session.update()
+            assert sorted(session.device_ids) == ['1', '2', '3',
+                                                  '_1000001', '_1000002']
+            device = session.device('1')
+            assert isinstance(device, tellduslive.AsyncDevice)
+            assert device.protocol == 'arctech'
+            assert await device.turn_on()
+            assert device.is_on
+            assert await device.dim(128)
+            assert device.dim_level == 128
+            assert await session.poll() == set()
+        finally:
+            await session.close()
+
+    run(main())
+    assert server.counts['device/turnOn'] == 1
+    assert server.counts['device/dim'] == 1
+
+
+def test_coalesce_sends_only_latest_command(server):
+    async def main():
+        session = tellduslive.AsyncSession(host=server.host, token='x')
+        try:
+            await session.update()
+            device = session.device('1')
+            device.coalesce(timedelta(milliseconds=50))
+            server.reset_counts()
+            for level in (10, 20, 30):
+                assert await device.dim(level)
+            assert device.dim_level == 30
+            assert await device.wait(5)
+            assert server.counts == {'device/dim': 1}
+        finally:
+            await session.close()
+
+    run(main())
+
+
+def test_coalesce_restores_state_if_send_fails(server, monkeypatch):
+    async def main():
+        session = tellduslive.AsyncSession(host=server.host, token='x')
+        try:
+            await session.update()
+            device = session.device('1')
+            device.coalesce(timedelta(milliseconds=50))
+            monkeypatch.setattr(server, 'respond',
+                                lambda name, params: {'error': 'failed'})
+            assert await device.turn_on()
+            assert device.is_on
+            assert not await device.wait(5)
+            assert device.state == 2
+        finally:
+            await session.close()
+
+    run(main())
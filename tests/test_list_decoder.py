@@ -0,0 +1,83 @@
+# -*- mode: python; coding: utf-8 -*-
+
+"""Tests of decoding list responses from chunks as they are read."""
+
+import json
+import os
+import sys
+from random import Random
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import tellduslive  # noqa: E402
+from fake_server import make_devices, make_sensors  # noqa: E402
+
+# pylint: disable=protected-access
+
+
+def body_of(response):
+    """Response encoded as by the API, not escaping non-ASCII text."""
+    return json.dumps(response, ensure_ascii=False).encode()
+
+
+def sensors():
+    items = make_sensors(5)
+    for item in items:
+        item['name'] = 'Våning ☃ {}'.format(item['id'])
+        item['extra'] = {'not': ['used']}
+    return items
+
+
+BODIES = {
+    'devices': ('devices/list', body_of({'device': make_devices(3)})),
+    'sensors': ('sensors/list', body_of({'sensor': sensors()})),
+    'empty': ('sensors/list', b'{"sensor": []}'),
+    'spaced': ('sensors/list', b' { "sensor" : [ \n ] } \n'),
+    'error': ('devices/list', b'{"error": "Invalid token"}'),
+    'other members': ('sensors/list',
+                      body_of({'sensor': sensors(), 'error': 'x'})),
+    'list not first': ('sensors/list',
+                       body_of({'error': None, 'sensor': sensors()})),
+}
+
+
+def split(body, rnd):
+    """Split body in chunks at random byte positions."""
+    cuts = sorted(rnd.sample(range(1, len(body)), min(len(body) - 1, 8)))
+    return [body[start:end]
+            for start, end in zip([0] + cuts, cuts + [len(body)])]
+
+
+@pytest.mark.parametrize('name', sorted(BODIES))
+def test_chunks_decode_as_whole_body(name):
+    path, body = BODIES[name]
+    expected = tellduslive._decode(body, path)
+    rnd = Random(name)
+    for _ in range(50):
+        chunks = split(body, rnd)
+        nbytes, result = tellduslive._stream_list(chunks,
+                                                  tellduslive.LIST_KEYS[path])
+        assert result == expected, chunks
+        assert nbytes == len(body)
+
+
+def test_byte_by_byte():
+    path, body = BODIES['sensors']
+    chunks = [body[i:i + 1] for i in range(len(body))]
+    assert tellduslive._stream_list(chunks, 'sensor')[1] == \
+        tellduslive._decode(body, path)
+
+
+@pytest.mark.parametrize('name', ['sensors', 'empty', 'error'])
+def test_truncated_body_fails(name):
+    path, body = BODIES[name]
+    for end in range(len(body) - 1, 0, -7):
+        with pytest.raises(ValueError):
+            tellduslive._decode(body[:end], path)
+        with pytest.raises(ValueError):
+            tellduslive._stream_list([body[:end]],
+                                     tellduslive.LIST_KEYS[path])
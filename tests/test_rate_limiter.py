@@ -0,0 +1,133 @@
+# -*- mode: python; coding: utf-8 -*-
+
+"""Tests of the client side RateLimiter."""
+
+import asyncio
+import os
+import sys
+from threading import Thread
+from time import monotonic, sleep
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import tellduslive  # noqa: E402
+from fake_server import FakeTelldusServer  # noqa: E402
+
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture
+def server():
+    with FakeTelldusServer(devices=3, sensors=2) as server:
+        yield server
+
+
+def fail_once(server, monkeypatch, endpoint):
+    """Make the server drop the connection of the first request
+    for endpoint."""
+    respond = server.respond
+    failed = []
+
+    def respond_or_fail(name, params):
+        if name == endpoint and not failed:
+            failed.append(name)
+            raise RuntimeError('dropped')
+        return respond(name, params)
+
+    monkeypatch.setattr(server, 'respond', respond_or_fail)
+
+
+def test_waiting_requests_are_served_by_priority():
+    limiter = tellduslive.RateLimiter(
+        rates={'command': 100, 'info': 100, 'list': 100}, total=20)
+    for _ in range(20):
+        limiter.acquire('sensor/info')  # empty the total bucket
+    order = []
+    threads = []
+    for path in ('devices/list', 'device/info', 'device/turnOn'):
+        threads.append(Thread(target=lambda path=path: (
+            limiter.acquire(path), order.append(path))))
+        threads[-1].start()
+        sleep(0.01)
+    for thread in threads:
+        thread.join(5)
+    assert order == ['device/turnOn', 'device/info', 'devices/list']
+
+
+def test_waiter_with_empty_bucket_does_not_block_others():
+    limiter = tellduslive.RateLimiter(rates={'command': 1},
+                                      burst={'command': 1})
+    limiter.acquire('device/turnOn')
+    command = Thread(target=limiter.acquire, args=('device/turnOff',))
+    command.start()
+    sleep(0.05)
+    start = monotonic()
+    limiter.acquire('devices/list')
+    assert monotonic() - start < 0.5
+    command.join(5)
+
+
+def test_backs_off_and_retries_failed_request(server, monkeypatch):
+    limiter = tellduslive.RateLimiter(rates={'list': 20}, max_backoff=0.1)
+    session = tellduslive.Session(host=server.host, token='x',
+                                  rate_limiter=limiter)
+    fail_once(server, monkeypatch, 'devices/list')
+    assert session._request_devices()
+    bucket = limiter._buckets['list']
+    assert bucket.rate < bucket.configured
+    assert server.counts['devices/list'] == 1  # counted once succeeded
+    session.close()
+
+
+def test_does_not_retry_errors_reported_by_api(server, monkeypatch):
+    limiter = tellduslive.RateLimiter()
+    session = tellduslive.Session(host=server.host, token='x',
+                                  rate_limiter=limiter)
+    monkeypatch.setattr(server, 'respond', lambda name, params: (
+        server.counts.update({name: server.counts.get(name, 0) + 1}) or
+        {'error': 'Device not found'}))
+    assert session._request('device/info', id='9') is None
+    assert server.counts['device/info'] == 1
+    bucket = limiter._buckets['info']
+    assert bucket.rate == bucket.configured
+    session.close()
+
+
+def test_async_acquire_waits_and_retries(server, monkeypatch):
+    pytest.importorskip('aiohttp')
+    limiter = tellduslive.RateLimiter(rates={'command': 5, 'list': 20},
+                                      burst={'command': 1},
+                                      max_backoff=0.1)
+
+    async def main():
+        await limiter.acquire_async('device/turnOn')
+        start = monotonic()
+        await limiter.acquire_async('device/turnOn')
+        assert monotonic() - start >= 0.1
+
+        session = tellduslive.AsyncSession(host=server.host, token='x',
+                                           rate_limiter=limiter)
+        request_once = session._request_once
+        failed = []
+
+        async def fail_once_async(path, **params):
+            # aiohttp resends requests on dropped keep-alive connections
+            if not failed:
+                failed.append(path)
+                return None, OSError('dropped')
+            return await request_once(path, **params)
+
+        monkeypatch.setattr(session, '_request_once', fail_once_async)
+        try:
+            assert await session._request_sensors()
+            assert failed == ['sensors/list']
+            bucket = limiter._buckets['list']
+            assert bucket.rate < bucket.configured
+        finally:
+            await session.close()
+
+    asyncio.run(main())
@@ -0,0 +1,349 @@
+# -*- mode: python; coding: utf-8 -*-
+
+"""Tests against the local fake Telldus server of the benchmarks."""
+
+import os
+import subprocess
+import sys
+import types
+from datetime import timedelta
+from threading import Event, Thread
+from time import monotonic, sleep, time
+
+import pytest
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import tellduslive  # noqa: E402
+from fake_server import (FakeTelldusServer, make_devices,  # noqa: E402
+                         make_packet)
+
+# pylint: disable=protected-access,redefined-outer-name
+
+
+def wait_until(condition, timeout=5):
+    """Wait for condition to become true, fail on timeout."""
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, 'timed out'
+        sleep(0.01)
+
+
+@pytest.fixture
+def server():
+    with FakeTelldusServer(devices=3, sensors=2) as server:
+        yield server
+
+
+def test_update_then_poll_merges_changed_sensors(server):
+    session = tellduslive.Session(host=server.host, token='x')
+    assert session.update()
+    assert sorted(session.device_ids) == ['1', '2', '3',
+                                          '_1000001', '_1000002']
+    assert session.poll() == set()
+
+    sensor = server.sensors[0]
+    sensor['lastUpdated'] += 60
+    sensor['data'][0]['value'] = '42.0'
+    assert session.poll() == {'_1000001'}
+    assert session.device('_1000001').value('temp', 0) == 42.0
+    assert session.poll() == set()
+    session.close()
+
+
+def test_daemon_lists_follow_commands_and_packets(server):
+    daemon = tellduslive.Daemon(dict(host=server.host, token='x'),
+                                address=('127.0.0.1', 0))
+    daemon.start()
+    url = 'http://{}:{}/api/'.format(*daemon.address)
+    try:
+        def states():
+            return [device['state'] for device in
+                    requests.get(url + 'devices/list').json()['device']]
+
+        assert states() == [2, 2, 2]
+        assert requests.get(url + 'device/turnOn',
+                            params={'id': '1'}).json() == {
+                                'status': 'success'}
+        assert states() == [1, 2, 2]
+
+        for level in ('x', '256'):
+            assert requests.get(url + 'device/dim',
+                                params={'id': '1', 'level': level}).json() == {
+                                    'error': 'Invalid level'}
+
+        packet = make_packet(server.sensors[0], seed=1)
+        daemon.session._got(packet, None)
+        sensors = requests.get(url + 'sensors/list').json()['sensor']
+        assert sensors[0]['data'] == packet['data']
+    finally:
+        daemon.close()
+
+
+def test_hybrid_fails_over_and_maps_new_devices(monkeypatch):
+    with FakeTelldusServer(devices=3, sensors=0, latency=0.02) as live, \
+            FakeTelldusServer(devices=3, sensors=0) as local:
+        def renumber():
+            for device in local.devices:
+                device['id'] = str(100 + int(device['id']))
+
+        renumber()
+        monkeypatch.setattr(tellduslive, 'TELLDUS_LIVE_API_URL',
+                            live.live_url)
+        session = tellduslive.Session('public', 'private', 'token', 'secret',
+                                      host=local.host, local_token='x')
+        hybrid = session._session
+        hybrid._probe_interval = 0.05
+        assert session.update()
+        wait_until(lambda: hybrid._to_local is not None)
+
+        local.reset_counts()
+        assert session.device('3').turn_on()
+        assert local.counts == {'device/turnOn': 1}
+
+        def down(*_):
+            raise RuntimeError('down')
+
+        respond = local.respond
+        monkeypatch.setattr(local, 'respond', down)
+        live.reset_counts()
+        assert session.device('3').turn_off()
+        assert live.counts == {'device/turnOff': 1}
+        assert not hybrid.routes()['local']['healthy']
+
+        monkeypatch.setattr(local, 'respond', respond)
+        wait_until(lambda: hybrid.routes()['local']['healthy'])
+
+        live.devices[:] = make_devices(5)
+        local.devices[:] = make_devices(5)
+        renumber()
+        wait_until(lambda: session.update() and
+                   sorted(session.device_ids) == ['1', '2', '3', '4', '5'])
+        session.close()
+
+
+def test_hybrid_maps_device_and_sensor_ids_separately(monkeypatch):
+    with FakeTelldusServer(devices=1, sensors=1, latency=0.02) as live, \
+            FakeTelldusServer(devices=1, sensors=1) as local:
+        live.sensors[0]['id'] = '1'  # same id as the device
+        local.devices[0]['id'] = '101'
+        monkeypatch.setattr(tellduslive, 'TELLDUS_LIVE_API_URL',
+                            live.live_url)
+        session = tellduslive.Session('public', 'private', 'token', 'secret',
+                                      host=local.host, local_token='x')
+        hybrid = session._session
+        assert session.update()
+        wait_until(lambda: hybrid._to_local is not None)
+
+        requests_seen = []
+        respond = local.respond
+        monkeypatch.setattr(local, 'respond', lambda name, params: (
+            requests_seen.append((name, params.get('id'))) or
+            respond(name, params)))
+        hybrid.get('device/turnOn', {'id': '1'})
+        assert hybrid.get('sensor/info', {'id': '1'}).json()['id'] == '1'
+        assert requests_seen == [('device/turnOn', '101'),
+                                 ('sensor/info', '1000001')]
+        session.close()
+
+
+def test_manager_updates_hubs_on_shared_pool():
+    servers = [FakeTelldusServer(devices=3, sensors=2).start()
+               for _ in range(3)]
+    manager = tellduslive.SessionManager(workers=2)
+    try:
+        for i, server in enumerate(servers):
+            manager.add('hub{}'.format(i), host=server.host, token='x')
+        assert manager.update() == {'hub0': True, 'hub1': True,
+                                    'hub2': True}
+        assert manager.hub_of('1') == ('hub0', 'hub1', 'hub2')
+        assert manager.device('_1000001', hub='hub1').is_sensor
+    finally:
+        manager.close()
+        for server in servers:
+            server.stop()
+
+
+def test_manager_rejects_duplicate_hub(server):
+    manager = tellduslive.SessionManager(workers=1)
+    try:
+        session = manager.add('hub', host=server.host, token='x')
+        with pytest.raises(ValueError):
+            manager.add('hub', host=server.host, token='x')
+        assert manager.hubs == {'hub': session}
+    finally:
+        manager.close()
+
+
+def test_manager_with_warm_listeners_does_not_deadlock(
+        server, tmp_path, monkeypatch):
+    """Background refreshes of warm started hubs must not take the
+    workers of the shared pool."""
+    class Tellstick:
+        def __init__(self, **_):
+            pass
+
+        def adddevice(self, device):
+            pass
+
+        def async_listen(self, callback):
+            pass
+
+    package = types.ModuleType('tellsticknet')
+    package.devicemanager = types.ModuleType('tellsticknet.devicemanager')
+    package.devicemanager.Tellstick = Tellstick
+    monkeypatch.setitem(sys.modules, 'tellsticknet', package)
+    monkeypatch.setitem(sys.modules, 'tellsticknet.devicemanager',
+                        package.devicemanager)
+
+    state_file = str(tmp_path / 'state.json')
+    session = tellduslive.Session(host=server.host, token='x')
+    session.update()
+    session.save_state(state_file)
+    session.close()
+
+    manager = tellduslive.SessionManager(workers=2)
+    results = []
+    try:
+        for i in range(3):
+            manager.add('hub{}'.format(i), host=server.host, token='x',
+                        listen=True, state_file=state_file)
+        thread = Thread(target=lambda: results.append(manager.update()),
+                        daemon=True)
+        thread.start()
+        thread.join(10)
+        assert results == [{'hub0': True, 'hub1': True, 'hub2': True}]
+    finally:
+        manager.close()
+
+
+def test_history_skips_repeated_readings():
+    history = tellduslive.SensorHistory()
+    session = tellduslive.BaseSession(history=history)
+    now = time()
+
+    def sensor(value, last_updated):
+        return {'id': 1, 'name': 'Ute', 'protocol': 'fineoffset',
+                'model': 'temperature', 'sensorId': 1,
+                'lastUpdated': last_updated,
+                'data': [{'name': 'temp', 'scale': '0', 'value': value}]}
+
+    session._merge({'_1': sensor('20', now - 600)})
+    # heard in a packet, then reported by the next poll
+    session._apply('_1', session._device('_1'),
+                   {'data': sensor('25', None)['data']})
+    session._merge({'_1': sensor('25', now - 300)})
+    timestamps, values = history.readings('_1', 'temp', 0)
+    assert list(values) == [20.0, 25.0]
+    assert list(timestamps) == sorted(timestamps)
+
+
+def test_batch_rejects_dim_without_level(server):
+    session = tellduslive.Session(host=server.host, token='x')
+    session.update()
+    with pytest.raises(ValueError):
+        session.execute_batch([('1', tellduslive.DIM, None)])
+    session.close()
+
+
+def test_update_retries_failed_device_info(server, monkeypatch):
+    respond = server.respond
+    failed = []
+
+    def flaky(endpoint, params):
+        if endpoint == 'device/info' and params.get('id') == '2' \
+                and not failed:
+            failed.append(params)
+            return {'error': 'busy'}
+        return respond(endpoint, params)
+
+    monkeypatch.setattr(server, 'respond', flaky)
+    session = tellduslive.Session(host=server.host, token='x')
+    assert not session.update()
+    assert session.device('2').protocol is None
+
+    server.reset_counts()
+    assert session.update()
+    assert server.counts['device/info'] == 1
+    assert session.device('2').protocol == 'arctech'
+    assert session._switch_index[('2', '1')] == '2'
+    session.close()
+
+
+def failing(server, monkeypatch, endpoint):
+    """Make server answer requests for endpoint with an error."""
+    respond = server.respond
+
+    def respond_or_fail(name, params):
+        if name == endpoint:
+            server.counts[name] = server.counts.get(name, 0) + 1
+            return {'error': 'failed'}
+        return respond(name, params)
+
+    monkeypatch.setattr(server, 'respond', respond_or_fail)
+
+
+def test_coalesce_sends_only_latest_command(server):
+    session = tellduslive.Session(host=server.host, token='x')
+    session.update()
+    device = session.device('1')
+    device.coalesce(timedelta(milliseconds=50))
+    server.reset_counts()
+    for level in (10, 20, 30):
+        assert device.dim(level)
+    assert device.dim_level == 30
+    assert device.wait(5)
+    assert server.counts == {'device/dim': 1}
+    assert device.dim_level == 30
+    session.close()
+
+
+def test_coalesce_restores_state_if_send_fails(server, monkeypatch):
+    session = tellduslive.Session(host=server.host, token='x')
+    session.update()
+    device = session.device('1')
+    device.coalesce(timedelta(milliseconds=50))
+    failing(server, monkeypatch, 'device/turnOn')
+    assert device.turn_on()
+    assert device.is_on
+    assert not device.wait(5)
+    assert not device.is_on
+    assert device.state == 2
+    session.close()
+
+
+def test_dispatcher_keeps_switch_and_sensor_with_same_id_apart():
+    dispatcher = tellduslive.BatchingCallbackDispatcher()
+    blocked = Event()
+    release = Event()
+    delivered = []
+
+    def callback(device):
+        if device is None:
+            blocked.set()
+            release.wait(5)
+        else:
+            delivered.append(device)
+
+    dispatcher.on_callback(callback, None)
+    assert blocked.wait(5)
+    switch = {'id': '5', 'state': 1}
+    sensor = {'id': '5', 'data': [{'name': 'temp', 'value': '1'}]}
+    dispatcher.on_callback(callback, switch)
+    dispatcher.on_callback(callback, sensor)
+    release.set()
+    wait_until(lambda: len(delivered) == 2)
+    assert delivered == [switch, sensor]
+    dispatcher.stop(5)
+
+
+def test_error_kind_does_not_import_requests():
+    code = ('import sys, tellduslive; '
+            'assert tellduslive._error_kind(TimeoutError()) == "timeout"; '
+            'assert tellduslive._error_kind(OSError()) == "error"; '
+            'assert "requests" not in sys.modules')
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+    assert tellduslive._error_kind(requests.ReadTimeout()) == 'timeout'